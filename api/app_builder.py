@@ -3,12 +3,23 @@ from typing import Annotated, List, Union
 import azure.functions as func
 from fastapi import Depends, FastAPI, Request, HTTPException, Security, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm, SecurityScopes
-from fastapi.responses import JSONResponse
-from jose import JWTError, jwt, ExpiredSignatureError
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel, ValidationError
 
-from dataworks.user_control import userLogins, User
+from dataworks.user_control import userLogins, User, passwordPool
+from api.token_cache import tokenCache
+from dataworks.session_factory import warm_in_background
+from dataworks import global_engine, caprice_engine
 from utilities.exceptions import ApiException
+from utilities.responses import FastJSONResponse
+from utilities.startup_timing import startupTimer, FirstResponseMiddleware
+from dataworks.query_executor import coalesce_stats
+from dataworks.result_cache import resultCache
+from dataworks.snapshot_store import snapshotDirectory
+from businessObjects.caprice import productCatalog
+from dataworks.query_metrics import pool_status
+from utilities.metrics import metrics, RouteMetricsMiddleware
+from utilities.compression import CompressionMiddleware
 
 from routers import caprice, demo
 
@@ -18,7 +29,29 @@ def build_app():
       scopes={ "me": "Read information about the current user.", "items": "Read items."},
    )
    
-   app = FastAPI()
+   app = FastAPI( default_response_class=FastJSONResponse)
+
+   # compress bodies with the best encoding the client accepts, innermost so the route metrics
+   # include the time it takes
+   app.add_middleware( CompressionMiddleware)
+
+   # record the time to the first response of this instance
+   app.add_middleware( FirstResponseMiddleware)
+
+   # latency and errors of every request, by route
+   app.add_middleware( RouteMetricsMiddleware)
+
+   # build the engines off the request path, optionally opening pooled connections too
+   warm_in_background( global_engine.engineSource, "Snowflake")
+   warm_in_background( caprice_engine.engineSource, "Caprice")
+
+   # the student catalog is only there when it has been turned on
+   catalogs = [ catalog for catalog in ( productCatalog, demo.studentCatalog) if catalog is not None]
+
+   # with durable snapshots on, read the catalogs from their local copies before the first request
+   if snapshotDirectory:
+      for catalog in catalogs:
+         catalog.warm_in_background()
 
    # include the demo router
    app.include_router( demo.router, dependencies=[Depends(oauth2_scheme)])
@@ -30,8 +63,15 @@ def build_app():
    ALGORITHM = "HS256"
    ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-   # load the user control db
-   logins = userLogins()
+   # load the user control db in the background, requests wait for it to be ready,
+   # then keep the directory current so disabled users drop out without a restart
+   logins = userLogins( load=False)
+   logins.start_loading()
+
+   # remember verified tokens, forgetting a user's tokens whenever their row changes.  this only
+   # saves the decode, get_current_user checks the directory for an enabled user on every request
+   tokens = tokenCache()
+   logins.add_listener( tokens.evict_users)
 
    class Token( BaseModel):
       access_token: str
@@ -43,6 +83,8 @@ def build_app():
       
    # create an access token
    def create_access_token( data: dict, expires_delta: Union[ timedelta, None] = None):
+      # jose is imported on first use to keep it out of the cold start
+      from jose import jwt
       # take a copy of the dictionary
       to_encode = data.copy()
       # if we've supplied a custom expiry
@@ -75,29 +117,38 @@ def build_app():
          headers={"WWW-Authenticate": authenticate_value},
       )
       
-      try:
-         # decode the authentication payload
-         payload = jwt.decode( token, SECRET_KEY, algorithms=[ALGORITHM])
-         # get the user name
-         username: str = payload.get("sub")
-         # if the user name is empty then raise a credentials exception
-         if username is None:
+      # reuse the claims if this token has already been verified
+      token_data = tokens.get( token)
+      if token_data is None:
+         from jose import JWTError, jwt, ExpiredSignatureError
+         try:
+            # decode the authentication payload
+            payload = jwt.decode( token, SECRET_KEY, algorithms=[ALGORITHM])
+            # get the user name
+            username: str = payload.get("sub")
+            # if the user name is empty then raise a credentials exception
+            if username is None:
+               raise credentials_exception
+            # get the scopes from the token
+            token_scopes = payload.get("scopes", [])
+            # build the token data
+            token_data = TokenData(scopes=token_scopes, username=username)
+         except ExpiredSignatureError: # <---- this one
+            raise HTTPException(status_code=403, detail="token has been expired")
+         except ( JWTError, ValidationError):
+            # trap any exceptions and re-raise
             raise credentials_exception
-         # get the scopes from the token
-         token_scopes = payload.get("scopes", [])
-         # build the token data
-         token_data = TokenData(scopes=token_scopes, username=username)
-      except ExpiredSignatureError: # <---- this one
-         raise HTTPException(status_code=403, detail="token has been expired")
-      except ( JWTError, ValidationError):
-         # trap any exceptions and re-raise
-         raise credentials_exception
+         # cache the verified claims until the token expires
+         if "exp" in payload:
+            tokens.put( token, username, payload["exp"], token_data)
       
       # from the user logins object get the user from the token supplied username
+      await logins.wait_ready()
       user = logins.get_user( username=token_data.username)
       
-      # if we can't find an enabled user
-      if user is None:
+      # if we can't find an enabled user, checked on every request so a token is refused as soon as
+      # a refresh disables its user, whether its claims came from the cache or a fresh decode
+      if user is None or not user.enabled:
          # raise a credentials excepttion
          raise credentials_exception
       
@@ -132,7 +183,8 @@ def build_app():
          content={
                "code": ex.code,
                "description": ex.description
-         }
+         },
+         headers=ex.headers
       ) 
    
    # token endpoint
@@ -140,7 +192,9 @@ def build_app():
    async def login_for_access_token(
       form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
    ):
-      user = logins.authenticate_user( form_data.username, form_data.password)
+      # check the password on the bounded pool so a burst of logins can't stall the loop
+      await logins.wait_ready()
+      user = await passwordPool.run( logins.authenticate_user, form_data.username, form_data.password)
       if not user:
          raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -169,6 +223,32 @@ def build_app():
 
    @app.get("/status/")
    async def read_system_status(current_user: Annotated[User, Depends(get_current_user)]):
-      return {"status": "ok"}
+      return {
+         "status": "ok",
+         "routes": metrics.summary( "http_request_duration_seconds"),
+         "errors": metrics.counters( "http_errors_total"),
+         "queries": metrics.summary( "db_query_duration_seconds"),
+         "queryRows": metrics.summary( "db_query_rows"),
+         "queryErrors": metrics.counters( "db_query_errors_total"),
+         "poolCheckout": metrics.summary( "db_pool_checkout_seconds"),
+         "responseBytes": metrics.summary( "http_response_bytes"),
+         "uncompressedBytes": metrics.summary( "http_response_uncompressed_bytes"),
+         "compressionCpu": metrics.summary( "http_compression_cpu_seconds"),
+         "pools": pool_status(),
+         "admission": { "Snowflake": global_engine.warehouseGate.report(), "Caprice": caprice_engine.warehouseGate.report()},
+         "passwordPool": { "admitted": passwordPool.admitted, "rejected": passwordPool.rejected},
+         "coalescing": coalesce_stats(),
+         "resultCache": resultCache.report(),
+         "catalogs": { catalog.name: catalog.report() for catalog in catalogs},
+      }
+
+   # the same measurements in the prometheus text format for a scraper
+   @app.get("/metrics", response_class=PlainTextResponse)
+   async def read_metrics(current_user: Annotated[User, Depends(get_current_user)]):
+      return PlainTextResponse( metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+   @app.get("/status/startup")
+   async def read_startup_timing(current_user: Annotated[User, Depends(get_current_user)]):
+      return startupTimer.report()
    
    return app
\ No newline at end of file
@@ -0,0 +1,86 @@
+##################################################################################################
+####                                                                                           ###
+####  the token cache remembers the claims of tokens that have already been verified so that   ###
+####  protected requests skip the jwt decode.  entries leave the cache at the token's expiry,  ###
+####  when the cache is full, or when the user behind them changes.  the cache only saves the  ###
+####  decode, get_current_user still checks the user is enabled on every request              ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+##################################################################################################
+from collections import OrderedDict
+from hashlib import sha256
+import threading
+import time
+import os
+
+# the number of verified tokens to remember, 0 turns the cache off
+tokenCacheSize = int( os.environ.get( "TokenCacheSize", "1024"))
+
+class tokenCache :
+   def __init__( self, size: int = tokenCacheSize) -> None:
+      self._size = size
+      # digest -> ( expiry, username, claims) in least recently used order
+      self._entries = OrderedDict()
+      # username -> digests so a changed user can be dropped in one go
+      self._byUser = {}
+      # the user directory refreshes on its own thread
+      self._lock = threading.Lock()
+
+   # key on a digest so raw tokens are never held as dictionary keys
+   def _digest( self, token: str) -> bytes:
+      return sha256( token.encode()).digest()
+
+   # return the cached claims for a token, or None if it has to be verified again
+   def get( self, token: str):
+      if self._size <= 0:
+         return None
+      digest = self._digest( token)
+      with self._lock:
+         entry = self._entries.get( digest)
+         if entry is None:
+            return None
+         expiry, username, claims = entry
+         # an expired token goes back through the full decode so it is rejected as before
+         if expiry <= time.time():
+            self._remove( digest, username)
+            return None
+         # mark the entry as recently used
+         self._entries.move_to_end( digest)
+         return claims
+
+   # remember the claims of a token that has just been verified
+   def put( self, token: str, username: str, expiry: float, claims) -> None:
+      if self._size <= 0:
+         return
+      digest = self._digest( token)
+      with self._lock:
+         self._entries[ digest] = ( expiry, username, claims)
+         self._entries.move_to_end( digest)
+         self._byUser.setdefault( username, set()).add( digest)
+         # drop the least recently used tokens once we are over size
+         while len( self._entries) > self._size:
+            oldest, ( _, oldestUser, _) = self._entries.popitem( last=False)
+            self._forget( oldest, oldestUser)
+
+   # drop every token belonging to the given users so their claims are decoded afresh, a disabled
+   # user is refused by get_current_user either way
+   def evict_users( self, usernames) -> None:
+      with self._lock:
+         for username in usernames:
+            for digest in self._byUser.pop( username, ()):
+               self._entries.pop( digest, None)
+
+   def _remove( self, digest: bytes, username: str) -> None:
+      del self._entries[ digest]
+      self._forget( digest, username)
+
+   def _forget( self, digest: bytes, username: str) -> None:
+      digests = self._byUser.get( username)
+      if digests is not None:
+         digests.discard( digest)
+         if not digests:
+            del self._byUser[ username]
+
+   def __len__( self) -> int:
+      return len( self._entries)
@@ -0,0 +1,84 @@
+##################################################################################################
+####                                                                                           ###
+####  benchmark of the per request token check with the verified token cache on and off.       ###
+####  build_app() runs on the sqlite stand in from the load test and GET /users/me is timed,   ###
+####  so every request goes through the real get_current_user dependency.  the cache size is   ###
+####  read at import, so each setting runs in its own process                                  ###
+####  run from the project root with:  python -m benchmarks.auth_cache                         ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+####  20261018        time the real dependency through build_app()                             ###
+##################################################################################################
+import argparse
+import asyncio
+import httpx
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+async def drive( app, users: int, requests: int) -> list:
+   from benchmarks.load_test import password
+   transport = httpx.ASGITransport( app=app)
+   async with httpx.AsyncClient( transport=transport, base_url="http://benchmark", timeout=120) as client:
+      # one token per user, minted before the clock starts
+      headers = []
+      for i in range( users):
+         response = await client.post( "/token", data={ "username": f"user{i}", "password": password, "scope": "me"})
+         response.raise_for_status()
+         headers.append( { "Authorization": "Bearer " + response.json()[ "access_token"]})
+      latencies = []
+      for i in range( requests):
+         start = time.perf_counter()
+         response = await client.get( "/users/me", headers=headers[ i % users])
+         response.raise_for_status()
+         latencies.append( time.perf_counter() - start)
+   return latencies
+
+# one measurement with whatever TokenCacheSize this process was started with
+def measure( requests: int) -> dict:
+   from benchmarks.load_test import stand_in_engines, seed, percentile
+   with tempfile.TemporaryDirectory() as directory:
+      engine = stand_in_engines( os.path.join( directory, "standin.db"))
+      counts = seed( engine, 0.05, random.Random( 1))
+      # imported after the engines are swapped so nothing reaches for snowflake
+      from api.app_builder import build_app
+      latencies = sorted( asyncio.run( drive( build_app(), counts[ "users"], requests)))
+   return { "users": counts[ "users"], "requests": requests, "mean": statistics.fmean( latencies),
+            "p50": statistics.median( latencies), "p99": percentile( latencies, 0.99)}
+
+# run measure in a child process with the given TokenCacheSize, None keeps the default
+def run( size, requests: int) -> dict:
+   env = dict( os.environ)
+   if size is None:
+      env.pop( "TokenCacheSize", None)
+   else:
+      env[ "TokenCacheSize"] = str( size)
+   output = subprocess.run( [ sys.executable, "-m", "benchmarks.auth_cache", "--measure", "--requests", str( requests)],
+                            env=env, check=True, capture_output=True, text=True).stdout
+   return json.loads( output.strip().splitlines()[ -1])
+
+def main( argv: list = None) -> int:
+   parser = argparse.ArgumentParser( prog="python -m benchmarks.auth_cache")
+   parser.add_argument( "--requests", type=int, default=2000)
+   parser.add_argument( "--measure", action="store_true", help="measure this process only and print the result as json")
+   args = parser.parse_args( argv)
+   if args.measure:
+      print( json.dumps( measure( args.requests)))
+      return 0
+
+   off = run( 0, args.requests)
+   on = run( None, args.requests)
+   print( f"GET /users/me  requests: {args.requests}  distinct tokens: {on[ 'users']}")
+   for label, result in ( ( "cache off", off), ( "cache on ", on)):
+      print( f"{label}: mean {result[ 'mean'] * 1e6:9.1f} us  p50 {result[ 'p50'] * 1e6:9.1f} us  p99 {result[ 'p99'] * 1e6:9.1f} us")
+   print( f"saved    : {( off[ 'mean'] - on[ 'mean']) * 1e6:9.1f} us per request")
+   return 0
+
+if __name__ == "__main__":
+   sys.exit( main())
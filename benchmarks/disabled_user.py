@@ -0,0 +1,79 @@
+##################################################################################################
+####                                                                                           ###
+####  check that disabling a user in user_control locks them out once the directory refreshes: ###
+####  the token they already used, a token they never used and a new login are all refused.    ###
+####  runs build_app() against the sqlite stand in from the load test and exits 1 on a failure ###
+####  run from the project root with:  python -m benchmarks.disabled_user                     ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+##################################################################################################
+import os
+
+# refresh the user directory quickly so the check doesn't wait out the default minute
+os.environ.setdefault( "UserRefreshSeconds", "0.2")
+
+from sqlalchemy import update
+import asyncio
+import httpx
+import random
+import sys
+import tempfile
+
+from benchmarks.load_test import stand_in_engines, seed, password
+from dataworks.user_control import user_control
+
+# seconds to wait for the refresh to pick up the change
+refreshWaitSeconds = 5
+
+async def check( app, engine) -> list:
+   failures = []
+   transport = httpx.ASGITransport( app=app)
+   async with httpx.AsyncClient( transport=transport, base_url="http://benchmark", timeout=30) as client:
+      async def login() -> httpx.Response:
+         return await client.post( "/token", data={ "username": "user0", "password": password})
+
+      # one token used before the change, so its claims are in the token cache, and one never used
+      response = await login()
+      response.raise_for_status()
+      used = { "Authorization": "Bearer " + response.json()[ "access_token"]}
+      unused = { "Authorization": "Bearer " + ( await login()).json()[ "access_token"]}
+      response = await client.get( "/status/", headers=used)
+      if response.status_code != 200:
+         failures.append( f"enabled user: GET /status/ answered {response.status_code}, expected 200")
+
+      with engine.begin() as connection:
+         connection.execute( update( user_control.__table__).where( user_control.username == "user0").values( enabled=False))
+
+      # wait for a background refresh to see the change
+      loop = asyncio.get_running_loop()
+      deadline = loop.time() + refreshWaitSeconds
+      while ( await client.get( "/status/", headers=used)).status_code == 200:
+         if loop.time() >= deadline:
+            failures.append( f"used token: still accepted {refreshWaitSeconds} s after the user was disabled")
+            break
+         await asyncio.sleep( 0.1)
+
+      response = await client.get( "/status/", headers=unused)
+      if response.status_code != 401:
+         failures.append( f"unused token: GET /status/ answered {response.status_code}, expected 401")
+      response = await login()
+      if response.status_code != 401:
+         failures.append( f"disabled user: POST /token answered {response.status_code}, expected 401")
+   return failures
+
+def main() -> int:
+   with tempfile.TemporaryDirectory() as directory:
+      engine = stand_in_engines( os.path.join( directory, "standin.db"))
+      seed( engine, 0.01, random.Random( 1))
+      # imported after the engines are swapped so nothing reaches for snowflake
+      from api.app_builder import build_app
+      failures = asyncio.run( check( build_app(), engine))
+   for failure in failures:
+      print( "FAIL " + failure)
+   if not failures:
+      print( "ok: a disabled user's tokens and logins are refused after the refresh")
+   return 1 if failures else 0
+
+if __name__ == "__main__":
+   sys.exit( main())
@@ -0,0 +1,121 @@
+##################################################################################################
+####                                                                                           ###
+####  checks that slow warehouse queries don't hold up the event loop: build_app() runs on    ###
+####  the sqlite stand in with the student table behind a view that sleeps on every query, and ###
+####  the latency of /status/ and a catalog route is measured with and without live student   ###
+####  queries in flight.  with the queries on the pool the two runs should look the same      ###
+####  run from the project root with:  python -m benchmarks.event_loop_blocking               ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+##################################################################################################
+import os
+
+# the student routes go live unless the catalog is asked for
+os.environ.setdefault( "StudentCatalog", "false")
+
+from sqlalchemy import event
+import argparse
+import asyncio
+import httpx
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.load_test import stand_in_engines, seed, percentile, password
+from dataworks import global_engine, caprice_engine
+
+# make every connection of both stand in engines able to sleep inside a query
+def add_sleep_function():
+   def sleep_ms( ms):
+      time.sleep( ms / 1000)
+      return ms
+   for source in ( global_engine.engineSource, caprice_engine.engineSource):
+      event.listen( source.get().pool, "connect", lambda connection, record: connection.create_function( "sleep_ms", 1, sleep_ms))
+
+# put the student rows behind a view that sleeps once per statement, like a busy warehouse
+def slow_down_students( engine, ms: int):
+   with engine.begin() as connection:
+      connection.exec_driver_sql( "ALTER TABLE dim_student RENAME TO dim_student_rows")
+      connection.exec_driver_sql( f"CREATE VIEW dim_student AS SELECT * FROM dim_student_rows WHERE ( SELECT sleep_ms( {ms})) >= 0")
+
+async def probe( client, headers: dict, url, requests: int) -> list:
+   latencies = []
+   for i in range( requests):
+      start = time.perf_counter()
+      response = await client.get( url( i), headers=headers)
+      response.raise_for_status()
+      latencies.append( time.perf_counter() - start)
+   return latencies
+
+# keep slow student queries in flight until told to stop, recording their latency and status
+async def slow_client( client, headers: dict, stop: asyncio.Event, latencies: list, statuses: dict):
+   while not stop.is_set():
+      start = time.perf_counter()
+      response = await client.get( "/assured/student", headers=headers, params={ "live": "true", "limit": 50})
+      latencies.append( time.perf_counter() - start)
+      statuses[ response.status_code] = statuses.get( response.status_code, 0) + 1
+
+async def scenario( client, headers: dict, counts: dict, requests: int, slowClients: int) -> dict:
+   stop = asyncio.Event()
+   latencies = []
+   statuses = {}
+   slow = [ asyncio.create_task( slow_client( client, headers, stop, latencies, statuses)) for _ in range( slowClients)]
+   # let the slow queries get going before the clock starts
+   await asyncio.sleep( 0.2 if slowClients else 0)
+   status, catalog = await asyncio.gather(
+      probe( client, headers, lambda i: "/status/", requests),
+      probe( client, headers, lambda i: f"/caprice/product/{i % counts[ 'products']}", requests))
+   stop.set()
+   await asyncio.gather( *slow)
+   return { "GET /status/": status, "GET /caprice/product/{product_id}": catalog, "slow": latencies, "slowStatuses": statuses}
+
+async def drive( app, counts: dict, requests: int, slowClients: int) -> dict:
+   transport = httpx.ASGITransport( app=app)
+   async with httpx.AsyncClient( transport=transport, base_url="http://benchmark", timeout=120) as client:
+      response = await client.post( "/token", data={ "username": "user0", "password": password})
+      response.raise_for_status()
+      headers = { "Authorization": "Bearer " + response.json()[ "access_token"]}
+      # load the product catalog before measuring
+      ( await client.get( "/caprice/product/0", headers=headers)).raise_for_status()
+      return {
+         "idle": await scenario( client, headers, counts, requests, 0),
+         f"{slowClients} slow queries": await scenario( client, headers, counts, requests, slowClients),
+      }
+
+def report( results: dict):
+   print( f"{'scenario':18} {'route':36} {'n':>5} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}  statuses")
+   for name, result in results.items():
+      for route, key in ( ( "GET /status/", "GET /status/"), ( "GET /caprice/product/{product_id}", "GET /caprice/product/{product_id}"),
+                          ( "GET /assured/student?live=true", "slow")):
+         ordered = sorted( result[ key])
+         if not ordered:
+            continue
+         statuses = dict( sorted( result[ "slowStatuses"].items())) if key == "slow" else ""
+         print( f"{name:18} {route:36} {len( ordered):5} {statistics.median( ordered) * 1000:8.2f} "
+                f"{percentile( ordered, 0.99) * 1000:8.2f} {ordered[ -1] * 1000:8.2f}  {statuses}")
+
+def main( argv: list = None) -> int:
+   parser = argparse.ArgumentParser( prog="python -m benchmarks.event_loop_blocking")
+   parser.add_argument( "--requests", type=int, default=300, help="requests per measured route and scenario")
+   parser.add_argument( "--slow-clients", type=int, default=16, help="slow queries kept in flight")
+   parser.add_argument( "--slow-ms", type=int, default=200, help="milliseconds each slow query sleeps")
+   parser.add_argument( "--scale", type=float, default=0.05, help="fraction of the load test table volumes")
+   args = parser.parse_args( argv)
+
+   with tempfile.TemporaryDirectory() as directory:
+      engine = stand_in_engines( os.path.join( directory, "standin.db"))
+      add_sleep_function()
+      counts = seed( engine, args.scale, random.Random( 1))
+      slow_down_students( engine, args.slow_ms)
+      # imported after the engines are swapped so nothing reaches for snowflake
+      from api.app_builder import build_app
+      results = asyncio.run( drive( build_app(), counts, args.requests, args.slow_clients))
+   print( f"each live student query sleeps {args.slow_ms} ms")
+   report( results)
+   return 0
+
+if __name__ == "__main__":
+   sys.exit( main())
@@ -0,0 +1,247 @@
+##################################################################################################
+####                                                                                           ###
+####  load test of the whole app without snowflake: both engines are swapped for a seeded      ###
+####  sqlite file, build_app() is driven in process and every route reports its throughput    ###
+####  and latency percentiles.  a latency budget makes it usable as a ci regression gate       ###
+####  run from the project root with:  python -m benchmarks.load_test                         ###
+####  in ci, e.g.:  python -m benchmarks.load_test --scale 0.1 --json out.json --max-p99-ms 500 ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+##################################################################################################
+import os
+
+# the engine modules read their connection settings at import, the stand in replaces them all
+for prefix in ( "Snowflake", "Caprice"):
+   for setting in ( "Account", "User", "Password", "Warehouse", "Role"):
+      os.environ.setdefault( prefix + setting, "benchmark")
+os.environ.setdefault( "SnowflakeControlDB", "ctl")
+os.environ.setdefault( "SnowflakeControlSchema", "sec")
+
+from sqlalchemy import insert
+import argparse
+import asyncio
+import httpx
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from dataworks import global_engine, caprice_engine
+from dataworks.session_factory import build_engine
+from dataworks.user_control import user_control, get_pwd_context
+from businessObjects.caprice import product
+from routers.demo import student, student_schedule
+
+# the warehouse schemas have no meaning in sqlite, every table lives in the one file
+schemaMap = { "canon.prod": None, os.environ[ "SnowflakeControlDB"] + "." + os.environ[ "SnowflakeControlSchema"]: None}
+
+password = "benchmark"
+
+# volumes at scale 1, roughly the shape of the production tables
+volumes = { "product": 5000, "dim_student": 20000, "courses_per_student": 10, "user_control": 200}
+
+# relative weight of each route in the request mix
+routeMix = [
+   ( "POST /token", 1),
+   ( "GET /caprice/product", 2),
+   ( "GET /caprice/product?limit=", 4),
+   ( "GET /caprice/product/{product_id}", 10),
+   ( "GET /caprice/product/measure/{measure}", 4),
+   ( "GET /caprice/product/salescategory/{salescategory}", 4),
+   ( "GET /caprice/product?live=true&limit=", 2),
+   ( "POST /caprice/product:batch", 2),
+   ( "GET /assured/student?limit=", 2),
+   ( "GET /assured/student/{student_id}", 8),
+   ( "GET /assured/student/{student_id}/schedule", 10),
+   ( "GET /assured/schedule/{schedule_id}", 4),
+   ( "GET /assured/schedule/{schedule_id}?limit=", 2),
+   ( "GET /assured/schedule/{schedule_id}/day/{day}", 4),
+   ( "POST /assured/student/schedule:batch", 2),
+   ( "GET /status/", 1),
+]
+
+measures = [ "kg", "l", "each", "box", "m"]
+days = [ "mon", "tue", "wed", "thu", "fri"]
+
+# stand in engines on one sqlite file, each timed and pooled like the real ones
+def stand_in_engines( path: str):
+   for source, prefix in ( ( global_engine.engineSource, "Snowflake"), ( caprice_engine.engineSource, "Caprice")):
+      engine = build_engine( "sqlite:///" + path, prefix, connect_args={ "check_same_thread": False})
+      source.use( engine.execution_options( schema_translate_map=schemaMap))
+   return global_engine.engineSource.get()
+
+def seed( engine, scale: float, rng: random.Random):
+   products = max( 1, int( volumes[ "product"] * scale))
+   students = max( 1, int( volumes[ "dim_student"] * scale))
+   users = max( 1, int( volumes[ "user_control"] * scale))
+   for table in ( product.__table__, student.__table__, student_schedule.__table__, user_control.__table__):
+      table.create( engine)
+   # one bcrypt hash shared by every user, hashing each would take minutes
+   hashed = get_pwd_context().hash( password)
+   with engine.begin() as connection:
+      connection.execute( insert( product.__table__), [
+         { "productid": i, "productname": f"product {i}", "measure": measures[ i % len( measures)],
+           "salescategory": f"category {i % 40}"}
+         for i in range( products)])
+      connection.execute( insert( student.__table__), [
+         { "personid": i, "lastname": f"last{i}", "firstname": f"first{i}", "fullname": f"first{i} last{i}",
+           "email": f"student{i}@example.com", "accid": f"acc{i}", "libid": f"lib{i}", "timeid": f"time{i}"}
+         for i in range( students)])
+      # distinct courses per student, each on a fixed day
+      connection.execute( insert( student_schedule.__table__), [
+         { "courseid": ( i * 7 + k * 37) % 500, "day": days[ k % len( days)], "studentid": str( i),
+           "course_time": f"{9 + k % 8}:00", "location": f"room {rng.randrange( 40)}",
+           "fullname": f"first{i} last{i}", "email": f"student{i}@example.com",
+           "instructorname": f"instructor {rng.randrange( 60)}"}
+         for i in range( students) for k in range( volumes[ "courses_per_student"])])
+      connection.execute( insert( user_control.__table__), [
+         { "username": f"user{i}", "full_name": f"user {i}", "email": f"user{i}@example.com",
+           "hashed_password": hashed, "enabled": True}
+         for i in range( users)])
+   return { "products": products, "students": students, "users": users}
+
+# the method, url and body of one request for a route in the mix
+def make_request( route: str, counts: dict, rng: random.Random):
+   productId = rng.randrange( counts[ "products"])
+   studentId = rng.randrange( counts[ "students"])
+   if route == "POST /token":
+      return "POST", "/token", { "data": { "username": f"user{rng.randrange( counts[ 'users'])}", "password": password}}
+   if route == "GET /caprice/product":
+      return "GET", "/caprice/product", {}
+   if route == "GET /caprice/product?limit=":
+      return "GET", "/caprice/product", { "params": { "limit": 100}}
+   if route == "GET /caprice/product/{product_id}":
+      return "GET", f"/caprice/product/{productId}", {}
+   if route == "GET /caprice/product/measure/{measure}":
+      return "GET", f"/caprice/product/measure/{rng.choice( measures)}", {}
+   if route == "GET /caprice/product/salescategory/{salescategory}":
+      return "GET", f"/caprice/product/salescategory/category {rng.randrange( 40)}", {}
+   if route == "GET /caprice/product?live=true&limit=":
+      return "GET", "/caprice/product", { "params": { "live": "true", "limit": 100}}
+   if route == "POST /caprice/product:batch":
+      return "POST", "/caprice/product:batch", { "json": { "ids": [ rng.randrange( counts[ "products"]) for _ in range( 50)]}}
+   if route == "GET /assured/student?limit=":
+      return "GET", "/assured/student", { "params": { "limit": 100}}
+   if route == "GET /assured/student/{student_id}":
+      return "GET", f"/assured/student/{studentId}", {}
+   if route == "GET /assured/student/{student_id}/schedule":
+      return "GET", f"/assured/student/{studentId}/schedule", {}
+   if route == "GET /assured/schedule/{schedule_id}":
+      return "GET", f"/assured/schedule/{rng.randrange( 500)}", {}
+   if route == "GET /assured/schedule/{schedule_id}?limit=":
+      return "GET", f"/assured/schedule/{rng.randrange( 500)}", { "params": { "limit": 100}}
+   if route == "GET /assured/schedule/{schedule_id}/day/{day}":
+      return "GET", f"/assured/schedule/{rng.randrange( 500)}/day/{rng.choice( days)}", {}
+   if route == "POST /assured/student/schedule:batch":
+      return "POST", "/assured/student/schedule:batch", { "json": { "ids": [ str( rng.randrange( counts[ "students"])) for _ in range( 50)]}}
+   if route == "GET /status/":
+      return "GET", "/status/", {}
+   raise ValueError( route)
+
+def percentile( ordered: list, q: float) -> float:
+   return ordered[ min( len( ordered) - 1, int( len( ordered) * q))]
+
+async def drive( app, counts: dict, requests: int, concurrency: int, seed: int):
+   rng = random.Random( seed)
+   routes = [ route for route, _ in routeMix]
+   # a route listed twice would silently double its weight
+   duplicates = sorted( { route for route in routes if routes.count( route) > 1})
+   if duplicates:
+      raise ValueError( f"routeMix lists {', '.join( duplicates)} more than once")
+   weights = [ weight for _, weight in routeMix]
+   plan = rng.choices( routes, weights=weights, k=requests)
+   latencies = { route: [] for route in routes}
+   statuses = { route: {} for route in routes}
+   transport = httpx.ASGITransport( app=app)
+   async with httpx.AsyncClient( transport=transport, base_url="http://benchmark", timeout=120) as client:
+      # one token for the run, minted before the clock starts
+      response = await client.post( "/token", data={ "username": "user0", "password": password})
+      response.raise_for_status()
+      headers = { "Authorization": "Bearer " + response.json()[ "access_token"]}
+      # the first catalog request loads the snapshot, that is start up rather than steady state
+      await client.get( "/caprice/product/0", headers=headers)
+
+      queue = asyncio.Queue()
+      for route in plan:
+         queue.put_nowait( route)
+
+      async def worker( workerRng: random.Random):
+         while not queue.empty():
+            route = queue.get_nowait()
+            method, url, options = make_request( route, counts, workerRng)
+            start = time.perf_counter()
+            response = await client.request( method, url, headers=headers, **options)
+            latencies[ route].append( time.perf_counter() - start)
+            statuses[ route][ response.status_code] = statuses[ route].get( response.status_code, 0) + 1
+
+      start = time.perf_counter()
+      await asyncio.gather( *[ worker( random.Random( seed + i + 1)) for i in range( concurrency)])
+      elapsed = time.perf_counter() - start
+   return elapsed, latencies, statuses
+
+def summarise( elapsed: float, latencies: dict, statuses: dict) -> dict:
+   routes = {}
+   for route, samples in latencies.items():
+      if not samples:
+         continue
+      ordered = sorted( samples)
+      routes[ route] = {
+         "requests": len( ordered),
+         "throughput": round( len( ordered) / elapsed, 1),
+         "p50_ms": round( statistics.median( ordered) * 1000, 2),
+         "p95_ms": round( percentile( ordered, 0.95) * 1000, 2),
+         "p99_ms": round( percentile( ordered, 0.99) * 1000, 2),
+         "statuses": { str( code): count for code, count in sorted( statuses[ route].items())},
+      }
+   total = sum( len( samples) for samples in latencies.values())
+   return { "elapsed_s": round( elapsed, 3), "requests": total, "throughput": round( total / elapsed, 1), "routes": routes}
+
+def report( summary: dict):
+   print( f"{summary[ 'requests']} requests in {summary[ 'elapsed_s']:.2f} s, {summary[ 'throughput']:.1f} req/s")
+   print( f"{'route':52} {'n':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  statuses")
+   for route, row in summary[ "routes"].items():
+      print( f"{route:52} {row[ 'requests']:6} {row[ 'throughput']:8.1f} {row[ 'p50_ms']:9.2f} "
+             f"{row[ 'p95_ms']:9.2f} {row[ 'p99_ms']:9.2f}  {row[ 'statuses']}")
+
+def main( argv: list = None) -> int:
+   parser = argparse.ArgumentParser( prog="python -m benchmarks.load_test")
+   parser.add_argument( "--requests", type=int, default=2000)
+   parser.add_argument( "--concurrency", type=int, default=16)
+   parser.add_argument( "--scale", type=float, default=1.0, help="fraction of the default table volumes")
+   parser.add_argument( "--seed", type=int, default=1)
+   parser.add_argument( "--json", help="also write the summary to this file")
+   parser.add_argument( "--max-p99-ms", type=float, help="exit 1 if any route's p99 is above this")
+   args = parser.parse_args( argv)
+
+   with tempfile.TemporaryDirectory() as directory:
+      engine = stand_in_engines( os.path.join( directory, "standin.db"))
+      start = time.perf_counter()
+      counts = seed( engine, args.scale, random.Random( args.seed))
+      print( f"seeded {counts} and {counts[ 'students'] * volumes[ 'courses_per_student']} schedule rows "
+             f"in {time.perf_counter() - start:.1f} s")
+
+      # imported after the engines are swapped so nothing reaches for snowflake
+      from api.app_builder import build_app
+      app = build_app()
+      summary = summarise( *asyncio.run( drive( app, counts, args.requests, args.concurrency, args.seed)))
+
+   report( summary)
+   if args.json:
+      with open( args.json, "w") as output:
+         json.dump( summary, output, indent=2)
+   failed = False
+   for route, row in summary[ "routes"].items():
+      errors = sum( count for code, count in row[ "statuses"].items() if int( code) >= 500)
+      if errors:
+         print( f"FAIL {route}: {errors} server errors")
+         failed = True
+      if args.max_p99_ms is not None and row[ "p99_ms"] > args.max_p99_ms:
+         print( f"FAIL {route}: p99 {row[ 'p99_ms']} ms over {args.max_p99_ms} ms")
+         failed = True
+   return 1 if failed else 0
+
+if __name__ == "__main__":
+   sys.exit( main())
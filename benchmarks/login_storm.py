@@ -0,0 +1,101 @@
+##################################################################################################
+####                                                                                           ###
+####  load test of a login storm: build_app() runs on the sqlite stand in from the load test   ###
+####  and /status/ is probed while a burst of POST /token requests runs, once with the bcrypt  ###
+####  checks on the bounded password pool and once with them inline on the event loop         ###
+####  run from the project root with:  python -m benchmarks.login_storm                       ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+####  20261018        drive the real app rather than a synthetic probe                         ###
+##################################################################################################
+import argparse
+import asyncio
+import httpx
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.load_test import stand_in_engines, seed, percentile, password
+from dataworks.user_control import passwordPool
+
+# the password check as it ran before the pool, on the event loop itself
+async def run_inline( fn, *args, **kwargs):
+   return fn( *args, **kwargs)
+
+# seconds between /status/ probes
+probeInterval = 0.005
+
+# probe /status/ every few milliseconds until the storm is over, each probe timed from when it was
+# due so the time spent waiting for a blocked event loop counts against it
+async def status_probe( client, headers: dict, stop: asyncio.Event, latencies: list):
+   due = time.perf_counter()
+   while True:
+      response = await client.get( "/status/", headers=headers)
+      response.raise_for_status()
+      latencies.append( time.perf_counter() - due)
+      # checked after the probe so one held up behind the last of the storm is still counted
+      if stop.is_set():
+         break
+      # an in process request can finish without ever yielding, so leave the loop to the logins
+      due = time.perf_counter() + probeInterval
+      await asyncio.sleep( probeInterval)
+
+async def storm( client, headers: dict, counts: dict, logins: int) -> tuple:
+   stop = asyncio.Event()
+   latencies = []
+   probe = asyncio.create_task( status_probe( client, headers, stop, latencies))
+   await asyncio.sleep( 0.05)
+   start = time.perf_counter()
+   responses = await asyncio.gather( *[
+      client.post( "/token", data={ "username": f"user{i % counts[ 'users']}", "password": password})
+      for i in range( logins)])
+   elapsed = time.perf_counter() - start
+   stop.set()
+   await probe
+   statuses = {}
+   for response in responses:
+      statuses[ response.status_code] = statuses.get( response.status_code, 0) + 1
+   return elapsed, statuses, latencies
+
+async def drive( app, counts: dict, logins: int) -> dict:
+   transport = httpx.ASGITransport( app=app)
+   async with httpx.AsyncClient( transport=transport, base_url="http://benchmark", timeout=120) as client:
+      response = await client.post( "/token", data={ "username": "user0", "password": password})
+      response.raise_for_status()
+      headers = { "Authorization": "Bearer " + response.json()[ "access_token"]}
+      results = { "pooled": await storm( client, headers, counts, logins)}
+      passwordPool.run = run_inline
+      try:
+         results[ "inline"] = await storm( client, headers, counts, logins)
+      finally:
+         del passwordPool.run
+   return results
+
+def report( label: str, elapsed: float, statuses: dict, latencies: list):
+   ordered = sorted( latencies)
+   print( f"{label:8} storm {elapsed * 1000:8.1f} ms  logins {dict( sorted( statuses.items()))}  "
+          f"status n {len( ordered):4}  p50 {statistics.median( ordered) * 1000:7.2f} ms  "
+          f"p99 {percentile( ordered, 0.99) * 1000:7.2f} ms  max {ordered[ -1] * 1000:7.2f} ms")
+
+def main( argv: list = None) -> int:
+   parser = argparse.ArgumentParser( prog="python -m benchmarks.login_storm")
+   parser.add_argument( "--logins", type=int, default=40, help="concurrent POST /token requests in the storm")
+   args = parser.parse_args( argv)
+
+   with tempfile.TemporaryDirectory() as directory:
+      engine = stand_in_engines( os.path.join( directory, "standin.db"))
+      counts = seed( engine, 0.01, random.Random( 1))
+      # imported after the engines are swapped so nothing reaches for snowflake
+      from api.app_builder import build_app
+      results = asyncio.run( drive( build_app(), counts, args.logins))
+   print( f"{args.logins} concurrent logins, password pool of {passwordPool.workers} workers and {passwordPool.queue_depth} waiting")
+   for label, result in results.items():
+      report( label, *result)
+   return 0
+
+if __name__ == "__main__":
+   sys.exit( main())
@@ -0,0 +1,77 @@
+##################################################################################################
+####                                                                                           ###
+####  benchmark of serialising 100k student_schedule rows: the old per row inspect() _asdict   ###
+####  with fast api's generic encoder against the compiled accessor, core rows and the fast    ###
+####  json response.  rows come from an in memory sqlite copy of the table                     ###
+####  run from the project root with:  python -m benchmarks.serializer                        ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+##################################################################################################
+import os
+
+# the engine modules read their connection settings at import, none of them are used here
+for prefix in ( "Snowflake", "Caprice"):
+   for setting in ( "Account", "User", "Password", "Warehouse", "Role"):
+      os.environ.setdefault( prefix + setting, "benchmark")
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, inspect, insert
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+import json
+import time
+
+from routers.demo import student_schedule
+from utilities.responses import dumps
+
+# the serialiser every model carried before the shared mixin
+def inspect_asdict( row):
+   return { c.key: getattr( row, c.key)
+      for c in inspect( row).mapper.column_attrs}
+
+def seed( rows: int):
+   engine = create_engine( "sqlite://", poolclass=StaticPool).execution_options( schema_translate_map={ "canon.prod": None})
+   student_schedule.__table__.create( engine)
+   with engine.begin() as connection:
+      connection.execute( insert( student_schedule.__table__), [
+         { "courseid": i % 500, "day": ( "mon", "tue", "wed", "thu", "fri")[ i % 5], "studentid": str( i),
+           "course_time": "09:00", "location": f"room {i % 40}", "fullname": f"student {i}",
+           "email": f"student{i}@example.com", "instructorname": f"instructor {i % 60}"}
+         for i in range( rows)
+      ])
+   return engine
+
+def timed( label: str, fn, rows: int):
+   start = time.perf_counter()
+   body = fn()
+   elapsed = time.perf_counter() - start
+   print( f"{label:44} {elapsed * 1000:9.1f} ms  {elapsed / rows * 1e6:6.2f} us/row  {len( body) / 1e6:6.1f} MB")
+   return elapsed
+
+def main( rows: int = 100000):
+   engine = seed( rows)
+   print( f"serialising {rows} student_schedule rows")
+
+   def before():
+      with Session( engine) as session:
+         objects = session.query( student_schedule).all()
+         # what the routes did: inspect per row, then the generic encoder and json.dumps
+         return json.dumps( jsonable_encoder( [ inspect_asdict( row) for row in objects])).encode()
+
+   def compiled():
+      with Session( engine) as session:
+         objects = student_schedule._fetch( session)
+         return dumps( [ row._asdict() for row in objects])
+
+   def core():
+      with Session( engine) as session:
+         return dumps( student_schedule._fetch( session, core=True))
+
+   baseline = timed( "before: orm + inspect _asdict + encoder", before, rows)
+   timed( "after : orm + compiled _asdict + fast json", compiled, rows)
+   fastest = timed( "after : core rows + fast json", core, rows)
+   print( f"speed up core rows over before: {baseline / fastest:.1f}x")
+
+if __name__ == "__main__":
+   main()
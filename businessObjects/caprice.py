@@ -1,8 +1,11 @@
-from sqlalchemy import inspect
 from sqlalchemy import Column, String, Integer
-from dataworks.caprice_engine import BusinessPersistent, globalSession
+from sqlalchemy.orm import Session
+from dataworks.caprice_engine import BusinessPersistent, globalSessionFactory
+from dataworks.catalog import catalogSnapshot
+from dataworks.snapshot_store import snapshot_store
 from fastapi import APIRouter
 from typing import Union
+import os
 
 class product( BusinessPersistent):
    __tablename__ = "product"
@@ -15,19 +18,19 @@ class product( BusinessPersistent):
 
    def __repr__(self):
       return f"product(id={self.productid!r}, name={self.productname!r}, measure={self.measure!r}, salescategory={self.salescategory!r})"  
-     
-   def _asdict( self):
-      return { c.key: getattr( self, c.key)
-         for c in inspect( self).mapper.column_attrs}   
-      
-   def all( self) :
-      return globalSession.query( product).all()   
-      
-   def byProductId( self, product_id: int) :
-      return globalSession.query( product).filter( product.productid == product_id).all()
-   
-   def byMeasure( self, measure: str) :
-      return globalSession.query( product).filter( product.measure == measure).all()   
-   
-   def bySalesCategory( self, salescategory: str) :
-      return globalSession.query( product).filter( product.salescategory == salescategory).all()  
\ No newline at end of file
+
+   # the query methods return orm objects, or plain row dictionaries when core is set,
+   # core rows go through the shared result cache when cache is set and keep only fields when given
+   def all( self, session: Session, core: bool = False, cache: bool = False, fields: Union[ str, None] = None) :
+      return product._fetch( session, core=core, cache=cache, fields=fields)
+
+# the product dimension is small and read heavily so the routes serve it from memory, starting
+# from the local copy when snapshots are on and never serving one older than the staleness bound
+productCatalog = catalogSnapshot(
+   product,
+   globalSessionFactory,
+   indexes = [ "productid", "measure", "salescategory"],
+   interval = float( os.environ.get( "ProductCatalogRefreshSeconds", "300")),
+   store = snapshot_store( product),
+   maxAge = float( os.environ.get( "ProductSnapshotMaxAgeSeconds", "86400"))
+)
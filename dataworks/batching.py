@@ -0,0 +1,35 @@
+##################################################################################################
+####                                                                                           ###
+####  batched lookups: many keys resolved with one in (...) query per chunk instead of one     ###
+####  warehouse round trip per key, with the rows handed back grouped by the key asked for    ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+##################################################################################################
+from sqlalchemy import select
+from utilities.exceptions import ApiException
+import os
+
+# keys per in (...) list, well under the statement limits of the warehouse
+batchChunkSize = int( os.environ.get( "BatchChunkSize", "1000"))
+
+# the most keys one batch request may ask for
+maxBatchKeys = int( os.environ.get( "MaxBatchKeys", "10000"))
+
+# drop repeated keys but keep the order they were asked for
+def unique_keys( keys: list) -> list:
+   if len( keys) > maxBatchKeys:
+      raise ApiException( status_code=400, code="batch_too_large", description=f"at most {maxBatchKeys} ids per batch")
+   return list( dict.fromkeys( keys))
+
+# fetch every row whose column is in keys, returns { key: [ rows]} with an entry for every key
+def fetch_grouped( session, model, column, keys: list, chunkSize: int = batchChunkSize) -> dict:
+   keys = unique_keys( keys)
+   grouped = { key: [] for key in keys}
+   stmt = select( *model.__table__.columns)
+   for start in range( 0, len( keys), chunkSize):
+      chunk = keys[ start:start + chunkSize]
+      for row in session.execute( stmt.where( column.in_( chunk))).mappings():
+         row = dict( row)
+         grouped.setdefault( row[ column.key], []).append( row)
+   return grouped
@@ -6,28 +6,56 @@
 ####                                                                                           ### 
 ####  date      by    action                                                                   ### 
 ####  20230913  AJT   Created                                                                  ### 
+####  20261018        thread local sessions for the query executor                             ###
+####  20261018        pooled engine and per request sessions                                   ###
+####  20261018        compiled row serialiser on the base classes                              ###
+####  20261018        engine built lazily on first use                                         ###
+####  20261018        admission gate in front of the warehouse                                 ###
 ##################################################################################################
-from sqlalchemy import create_engine
-from snowflake.sqlalchemy import URL
-from sqlalchemy.orm import declarative_base, Session
+from sqlalchemy.orm import declarative_base, scoped_session
+from dataworks.session_factory import build_engine, session_dependency, lazyEngine, lazySessionFactory, admission_gate
+from dataworks.serialization import RowSerializable
 from pydantic import BaseModel
 import os
 
-# default global database connection
-globalEngine = create_engine( 
-   URL( 
-      account = os.environ.get("CapriceAccount"),
-      user = os.environ.get("CapriceUser"),
-      password = os.environ.get("CapricePassword"),
-      warehouse = os.environ.get("CapriceWarehouse"),
-      role = os.environ.get("CapriceRole")       
+# default global database connection, built on first use because importing the
+# snowflake connector is the largest single cost of a cold start
+def _build_engine():
+   from snowflake.sqlalchemy import URL
+   return build_engine(
+      URL(
+         account = os.environ.get("CapriceAccount"),
+         user = os.environ.get("CapriceUser"),
+         password = os.environ.get("CapricePassword"),
+         warehouse = os.environ.get("CapriceWarehouse"),
+         role = os.environ.get("CapriceRole")
+      ),
+      "Caprice"
    )
-)     
+
+engineSource = lazyEngine( _build_engine, "Caprice")
+
+# keep globalEngine as a module attribute, creating the engine the first time it is read
+def __getattr__( name):
+   if name == "globalEngine":
+      return engineSource.get()
+   raise AttributeError( f"module {__name__!r} has no attribute {name!r}")
 
 # create a new control base class
-ControlPersistent = declarative_base()
-BusinessPersistent = declarative_base()
+# both bases share the compiled row serialiser
+ControlPersistent = declarative_base( cls=RowSerializable)
+BusinessPersistent = declarative_base( cls=RowSerializable)
 class BusinessValidated( BaseModel) :
    pass
 
-globalSession = Session( globalEngine)
\ No newline at end of file
+# bounds the queries in flight against the warehouse, shedding load once it is saturated
+warehouseGate = admission_gate( "Caprice")
+
+# sessions are cut from the pooled engine once it exists
+globalSessionFactory = lazySessionFactory( engineSource, warehouseGate)
+
+# thread local session for work outside a request, such as loading the user logins
+globalSession = scoped_session( globalSessionFactory)
+
+# fast api dependency giving each request its own session
+get_session = session_dependency( globalSessionFactory)
@@ -0,0 +1,202 @@
+##################################################################################################
+####                                                                                           ###
+####  the catalog snapshot holds a small dimension table in memory with hash indexes on chosen ###
+####  columns.  it loads on first use, refreshes on a background thread and swaps each new     ###
+####  snapshot in whole so readers never see a half built one                                 ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+####  20261018        content version for conditional requests                                 ###
+####  20261018        durable local copy with a staleness bound                                ###
+##################################################################################################
+from dataworks.query_executor import run_query
+from dataworks.paging import primary_key, slice_page
+from utilities.responses import dumps
+from utilities.exceptions import ApiException
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger( __name__)
+
+class catalogSnapshot :
+   # store keeps a local copy that a new instance starts from, maxAge is the oldest snapshot in
+   # seconds that will be served, 0 serves any age
+   def __init__( self, model, sessionFactory, indexes: list, interval: float, store=None, maxAge: float = 0) -> None:
+      self._model = model
+      self._sessionFactory = sessionFactory
+      self._indexes = list( indexes)
+      self._interval = interval
+      self._store = store
+      self._maxAge = maxAge
+      # ( rows, { column: { value: [ rows]}}, primary keys) swapped in a single assignment
+      self._state = None
+      self._loadedAt = None
+      self._version = None
+      self._loadLock = threading.Lock()
+      self._refresher = None
+      self._stopRefresh = threading.Event()
+      # the python type of each indexed column so path strings can be matched
+      self._types = { column: model.__table__.c[ column].type.python_type for column in self._indexes}
+
+   @property
+   def loaded( self) -> bool:
+      return self._state is not None
+
+   # changes only when the rows do, so it can stand in for the content in an etag
+   @property
+   def version( self):
+      return self._version
+
+   @property
+   def loadedAt( self):
+      return self._loadedAt
+
+   # seconds since the rows were read from the warehouse
+   @property
+   def age( self) -> float:
+      return 0.0 if self._loadedAt is None else time.time() - self._loadedAt
+
+   @property
+   def stale( self) -> bool:
+      return self._maxAge > 0 and self._loadedAt is not None and self.age > self._maxAge
+
+   # read the whole table and build the indexes, then swap the snapshot in and save a local copy
+   def load( self):
+      session = self._sessionFactory()
+      try:
+         rows = [ row._asdict() for row in session.query( self._model).all()]
+      finally:
+         session.close()
+      count = self._swap( rows, time.time())
+      if self._store is not None:
+         try:
+            self._store.save( rows, self._loadedAt)
+         except Exception as ex:
+            # the snapshot in memory is good, the next instance just starts from the warehouse
+            logger.warning( "%s snapshot save failed: %s", self._model.__tablename__, ex)
+      return count
+
+   # start from the local copy if there is one within the staleness bound, True if it was used
+   def load_local( self) -> bool:
+      if self._store is None:
+         return False
+      try:
+         saved = self._store.read()
+      except Exception as ex:
+         logger.warning( "%s snapshot read failed: %s", self._model.__tablename__, ex)
+         return False
+      if saved is None:
+         return False
+      rows, loadedAt = saved
+      if self._maxAge > 0 and time.time() - loadedAt > self._maxAge:
+         return False
+      self._swap( rows, loadedAt)
+      return True
+
+   def _swap( self, rows: list, loadedAt: float):
+      # hold the rows in primary key order so pages can be cut with a binary search
+      keys = [ column.key for column in primary_key( self._model)]
+      rows.sort( key=lambda row: tuple( row[ key] for key in keys))
+      sortKeys = [ tuple( row[ key] for key in keys) for row in rows]
+      indexes = { column: {} for column in self._indexes}
+      for row in rows:
+         for column, index in indexes.items():
+            index.setdefault( row[ column], []).append( row)
+      self._state = ( rows, indexes, sortKeys)
+      # a digest of the content, unchanged by a refresh that found nothing new, set after the swap so
+      # a reader never tags old rows with the new version
+      self._version = hashlib.blake2b( dumps( rows), digest_size=16).hexdigest()
+      self._loadedAt = loadedAt
+      return len( rows)
+
+   # load on first use from the local copy or else the warehouse, only one caller does the work and
+   # the rest wait for it.  a snapshot past the staleness bound is reloaded before it is served again
+   def ensure_loaded( self):
+      if self._state is None or self.stale:
+         with self._loadLock:
+            if self._state is None:
+               if not self.load_local():
+                  self.load()
+               self.start_refresh()
+            elif self.stale:
+               try:
+                  self.load()
+               except Exception as ex:
+                  logger.warning( "%s catalog reload failed: %s", self._model.__tablename__, ex)
+                  raise ApiException( status_code=503, code="snapshot_stale",
+                     description=f"{self._model.__tablename__} is past its staleness bound and could not be refreshed",
+                     headers={ "Retry-After": str( max( 1, int( self._interval)))})
+
+   # await the first load, or the reload of a stale snapshot, without blocking the event loop.  the
+   # readers below only ever use the snapshot as it stands, so callers on the loop await this first
+   async def ready( self):
+      if self._state is None or self.stale:
+         await run_query( self.ensure_loaded)
+
+   # load in the background so the first request finds the snapshot waiting
+   def warm_in_background( self):
+      def warm():
+         try:
+            self.ensure_loaded()
+         except Exception as ex:
+            # the first request will try again and surface the error to its caller
+            logger.warning( "%s catalog warm up failed: %s", self._model.__tablename__, ex)
+      thread = threading.Thread( target=warm, name=self._model.__tablename__ + "-warm", daemon=True)
+      thread.start()
+      return thread
+
+   # the current snapshot, never loading on the caller's thread
+   def _current( self):
+      state = self._state
+      if state is None:
+         raise ApiException( status_code=503, code="snapshot_loading",
+            description=f"{self._model.__tablename__} is still loading, please retry shortly", headers={ "Retry-After": "1"})
+      return state
+
+   def all( self) -> list:
+      return self._current()[ 0]
+
+   # return the rows whose column equals the value, matching on the column's own type
+   def lookup( self, column: str, value) -> list:
+      indexes = self._current()[ 1]
+      try:
+         value = self._types[ column]( value)
+      except ( TypeError, ValueError):
+         # a value that can't be the column's type can't match anything
+         return []
+      return indexes[ column].get( value, [])
+
+   # one keyset page of the snapshot, returns the rows and the next cursor
+   def page( self, limit, cursor, fields):
+      rows, _, sortKeys = self._current()
+      return slice_page( self._model, rows, sortKeys, limit, cursor, fields)
+
+   # refresh the snapshot every interval seconds on a daemon thread
+   def start_refresh( self):
+      if self._interval <= 0 or self._refresher is not None:
+         return
+      def run():
+         # a snapshot started from a local copy is already part way through its interval
+         delay = self._interval - self.age
+         while not self._stopRefresh.wait( max( 0.0, delay)):
+            delay = self._interval
+            try:
+               self.load()
+            except Exception as ex:
+               # keep serving the last good snapshot and try again next interval
+               logger.warning( "%s catalog refresh failed: %s", self._model.__tablename__, ex)
+      self._refresher = threading.Thread( target=run, name=self._model.__tablename__ + "-catalog", daemon=True)
+      self._refresher.start()
+
+   def report( self) -> dict:
+      return { "loaded": self.loaded, "rows": len( self._state[ 0]) if self._state else 0, "age": round( self.age, 1),
+               "maxAge": self._maxAge, "durable": self._store is not None}
+
+   @property
+   def name( self) -> str:
+      return self._model.__tablename__
+
+   def stop_refresh( self):
+      self._stopRefresh.set()
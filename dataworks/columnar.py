@@ -0,0 +1,167 @@
+##################################################################################################
+####                                                                                           ###
+####  columnar export: a whole table streamed as arrow ipc or parquet for dataframe consumers.  ###
+####  snowflake hands its result chunks back as arrow, so the batches go from the connector to  ###
+####  the socket without a python object per row.  pyarrow is optional, without it the export  ###
+####  routes answer 501                                                                        ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+##################################################################################################
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from typing import Union
+from dataworks.paging import primary_key, project
+from dataworks.streaming import stream_batches
+from utilities.exceptions import ApiException
+import datetime
+import decimal
+import os
+
+arrowMediaType = "application/vnd.apache.arrow.stream"
+parquetMediaType = "application/vnd.apache.parquet"
+
+# format name -> ( media type, file extension)
+exportFormats = { "arrow": ( arrowMediaType, "arrows"), "parquet": ( parquetMediaType, "parquet")}
+
+# rows per arrow batch when the driver can't hand back arrow itself
+exportBatchSize = int( os.environ.get( "ExportBatchSize", "65536"))
+
+# pyarrow is imported on first use, it is large and only the export routes need it
+def _pyarrow():
+   try:
+      import pyarrow
+   except ImportError:
+      raise ApiException( status_code=501, code="export_unavailable", description="columnar export needs pyarrow installed")
+   return pyarrow
+
+# ?format=arrow|parquet, otherwise parquet if the caller accepts it, otherwise arrow
+def export_format( request: Request, format: Union[ str, None]) -> str:
+   if format is None:
+      return "parquet" if parquetMediaType in request.headers.get( "accept", "") else "arrow"
+   if format not in exportFormats:
+      raise ApiException( status_code=400, code="invalid_format", description=f"format must be one of: {', '.join( exportFormats)}")
+   return format
+
+# the arrow type of a column, taken from the python type sql alchemy maps it to
+def _arrow_type( pa, column):
+   pythonType = column.type.python_type
+   if pythonType is bool:
+      return pa.bool_()
+   if pythonType is int:
+      return pa.int64()
+   if pythonType is float:
+      return pa.float64()
+   if pythonType is decimal.Decimal:
+      precision = getattr( column.type, "precision", None)
+      return pa.decimal128( precision, getattr( column.type, "scale", None) or 0) if precision else pa.float64()
+   if pythonType is datetime.datetime:
+      return pa.timestamp( "us")
+   if pythonType is datetime.date:
+      return pa.date32()
+   if pythonType is bytes:
+      return pa.binary()
+   return pa.string()
+
+# a fixed schema from the model so every batch has the same column names and types, snowflake
+# names its arrow columns in upper case and narrows integers chunk by chunk
+def arrow_schema( pa, columns: list):
+   return pa.schema( [ pa.field( column.key, _arrow_type( pa, column)) for column in columns])
+
+# the cursor's own arrow batches, or None when the driver can't hand the result back as arrow.
+# snowflake cursors always have fetch_arrow_batches but it refuses a result sent as json, e.g. when
+# the session's PYTHON_CONNECTOR_QUERY_RESULT_FORMAT is JSON, before any rows have been read
+def _arrow_batches( cursor):
+   if not hasattr( cursor, "fetch_arrow_batches"):
+      return None
+   from snowflake.connector.errors import NotSupportedError
+   try:
+      return cursor.fetch_arrow_batches()
+   except NotSupportedError:
+      return None
+
+# yield the query's rows as arrow tables, the generator owns its session like fetch_batches
+def fetch_arrow( sessionFactory, stmt, schema):
+   pa = _pyarrow()
+   session = sessionFactory()
+   try:
+      result = session.connection().execute( stmt)
+      batches = _arrow_batches( result.cursor)
+      if batches is not None:
+         for table in batches:
+            yield table.rename_columns( schema.names).cast( schema)
+      else:
+         # a json result, or another driver such as the sqlite benchmark stand in, is converted a
+         # partition at a time
+         for rows in result.partitions( exportBatchSize):
+            yield pa.Table.from_arrays( [ pa.array( values, type=field.type) for values, field in zip( zip( *rows), schema)], schema=schema)
+      result.close()
+   finally:
+      session.close()
+
+# a write only file that hands back whatever has been written since it was last asked, keeping
+# the running position the parquet writer needs for its footer
+class _chunkSink :
+   def __init__( self) -> None:
+      self._parts = []
+      self._position = 0
+      self.closed = False
+
+   def write( self, data) -> int:
+      data = bytes( data)
+      self._parts.append( data)
+      self._position += len( data)
+      return len( data)
+
+   def tell( self) -> int:
+      return self._position
+
+   def flush( self) -> None:
+      pass
+
+   def close( self) -> None:
+      self.closed = True
+
+   def writable( self) -> bool:
+      return True
+
+   def take( self) -> bytes:
+      chunk = b"".join( self._parts)
+      self._parts = []
+      return chunk
+
+# encode arrow tables into the bytes of one arrow ipc stream or parquet file, each table becomes an
+# ipc record batch or a parquet row group as soon as it arrives
+def encode_tables( tables, schema, format: str):
+   pa = _pyarrow()
+   sink = _chunkSink()
+   if format == "parquet":
+      import pyarrow.parquet
+      writer = pyarrow.parquet.ParquetWriter( pa.PythonFile( sink, mode="w"), schema)
+   else:
+      writer = pa.ipc.new_stream( pa.PythonFile( sink, mode="w"), schema)
+   try:
+      for table in tables:
+         writer.write_table( table)
+         chunk = sink.take()
+         if chunk:
+            yield chunk
+      # the end of stream marker or the parquet footer
+      writer.close()
+      yield sink.take()
+   finally:
+      tables.close()
+
+# stream a model query as arrow ipc or parquet, optionally projected onto the named fields
+async def export_query( sessionFactory, model, filters: list, request: Request, format: Union[ str, None] = None, fields: Union[ str, None] = None) -> StreamingResponse:
+   # fail on a bad format or a missing pyarrow before any headers go out
+   format = export_format( request, format)
+   pa = _pyarrow()
+   columns = project( model, fields)
+   schema = arrow_schema( pa, columns)
+   stmt = select( *columns).where( *filters).order_by( *primary_key( model))
+   mediaType, extension = exportFormats[ format]
+   chunks = encode_tables( fetch_arrow( sessionFactory, stmt, schema), schema, format)
+   headers = { "Content-Disposition": f'attachment; filename="{model.__tablename__}.{extension}"'}
+   return await stream_batches( sessionFactory, chunks, mediaType, encode=bytes, headers=headers)
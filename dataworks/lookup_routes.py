@@ -0,0 +1,127 @@
+##################################################################################################
+####                                                                                           ###
+####  declarative lookup routes: each lookup names a model, the key columns and the path that  ###
+####  carries them, and the get endpoint is generated from it with typed path parameters.  the ###
+####  select is built once with a bound parameter per key, and once more per projection, so   ###
+####  statements are constructed and compiled once per process and requests only bind values  ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+##################################################################################################
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy import select, bindparam
+from sqlalchemy.orm import Session
+from typing import Union
+from dataworks.query_executor import run_admitted, run_coalesced
+from dataworks.paging import wants_page, keyset_page, set_next_cursor, project, project_rows
+from dataworks.streaming import wants_stream, stream_query, stream_rows
+from dataworks.result_cache import resultCache
+from utilities.conditional import conditional_json, version_etag, etag_matches, not_modified, versioned_json
+import inspect
+import re
+
+class lookupRoute :
+   # path placeholders are matched to the key columns in order, e.g. "/schedule/{schedule_id}/day/{day}"
+   # with [ student_schedule.courseid, student_schedule.day].  catalog serves the lookup from a
+   # snapshot unless the caller asks for live, cache sends database rows through the result cache
+   # except when live was asked for, stream and page add the ndjson and keyset paging options.
+   # every lookup takes ?fields=
+   def __init__( self, path: str, model, keys: list, catalog=None, cache: bool = False, stream: bool = False, page: bool = False) -> None:
+      self.path = path
+      self.model = model
+      self.keys = list( keys)
+      self.params = re.findall( r"{(\w+)}", path)
+      if len( self.params) != len( self.keys):
+         raise ValueError( f"{path} has {len( self.params)} path parameters for {len( self.keys)} key columns")
+      if catalog is not None and len( self.keys) != 1:
+         raise ValueError( f"{path} can only be served from a catalog with a single key column")
+      self.catalog = catalog
+      self.cache = cache
+      self.stream = stream
+      self.page = page
+      self.name = f"{model.__tablename__}_by_{'_'.join( key.key for key in self.keys)}"
+      # projected statements by column names, built on first use
+      self._statements = {}
+      # built once, every request executes this same statement with its own values
+      self.stmt = self.statement( list( model.__table__.columns))
+
+   # the prebuilt select of the given columns, one per distinct projection
+   def statement( self, columns: list):
+      names = tuple( column.key for column in columns)
+      stmt = self._statements.get( names)
+      if stmt is None:
+         stmt = select( *columns).where(
+            *[ key == bindparam( param, type_=key.type) for key, param in zip( self.keys, self.params)])
+         self._statements[ names] = stmt
+      return stmt
+
+   # the same lookup as filters, for the paged and streamed forms that build their own select
+   def filters( self, values: tuple) -> list:
+      return [ key == value for key, value in zip( self.keys, values)]
+
+# run a lookup's prebuilt statement, a module function so the route, the projection and whether
+# the result cache is used are all part of the coalescing key
+def _lookup_rows( session, route: lookupRoute, values: tuple, fields: Union[ str, None] = None, cache: bool = False) -> list:
+   stmt = route.statement( project( route.model, fields))
+   params = dict( zip( route.params, values))
+   if cache:
+      return resultCache.rows( session, stmt, route.model.__tablename__, params)
+   return [ dict( row) for row in session.execute( stmt, params).mappings()]
+
+def _endpoint( route: lookupRoute, sessionFactory, get_session):
+   gate = getattr( sessionFactory, "gate", None)
+
+   async def endpoint( **kwargs):
+      request = kwargs[ "request"]
+      values = tuple( kwargs[ param] for param in route.params)
+      stream = kwargs.get( "stream", False)
+      fields = kwargs.get( "fields")
+      # serve from the catalog snapshot unless the caller asks for a live query
+      if route.catalog is not None and not kwargs.get( "live", False):
+         await route.catalog.ready()
+         rows = route.catalog.lookup( route.keys[ 0].key, values[ 0])
+         if route.stream and wants_stream( request, stream):
+            return stream_rows( route.model, rows, fields)
+         # the snapshot version alone proves whether the client's copy is still current
+         etag = version_etag( route.catalog.version, request)
+         if etag_matches( request, etag):
+            return not_modified( etag)
+         return versioned_json( project_rows( route.model, rows, fields), etag)
+      # a live stream comes straight from a server side cursor
+      if route.stream and wants_stream( request, stream):
+         return await stream_query( sessionFactory, route.model, route.filters( values), fields)
+      # a page runs as a keyset range scan over the primary key
+      if route.page and wants_page( kwargs.get( "limit"), kwargs.get( "cursor")):
+         rows, nextCursor = await run_admitted( gate, keyset_page, kwargs[ "session"], route.model, route.filters( values), kwargs.get( "limit"), kwargs.get( "cursor"), fields)
+         Result = conditional_json( request, rows)
+         set_next_cursor( Result, nextCursor)
+         return Result
+      # the projection is normalised so the same columns asked for in any order share a query
+      fields = ",".join( column.key for column in project( route.model, fields)) if fields else None
+      # live skips the result cache as well as the catalog, the caller wants the warehouse as it is now
+      cache = route.cache and not kwargs.get( "live", False)
+      rows = await run_coalesced( sessionFactory, _lookup_rows, route, values, fields, cache)
+      return conditional_json( request, rows)
+
+   # fast api reads the parameters from the signature, the path ones typed from their columns
+   keyword = inspect.Parameter.KEYWORD_ONLY
+   parameters = [ inspect.Parameter( param, keyword, annotation=key.type.python_type) for key, param in zip( route.keys, route.params)]
+   parameters.append( inspect.Parameter( "request", keyword, annotation=Request))
+   if route.catalog is not None:
+      parameters.append( inspect.Parameter( "live", keyword, annotation=bool, default=False))
+   if route.stream:
+      parameters.append( inspect.Parameter( "stream", keyword, annotation=bool, default=False))
+   if route.page:
+      parameters.append( inspect.Parameter( "limit", keyword, annotation=Union[ int, None], default=None))
+      parameters.append( inspect.Parameter( "cursor", keyword, annotation=Union[ str, None], default=None))
+   parameters.append( inspect.Parameter( "fields", keyword, annotation=Union[ str, None], default=None))
+   if route.page:
+      parameters.append( inspect.Parameter( "session", keyword, annotation=Session, default=Depends( get_session)))
+   endpoint.__signature__ = inspect.Signature( parameters)
+   endpoint.__name__ = route.name
+   return endpoint
+
+# add a get endpoint to the router for every lookup, in the order given
+def add_lookup_routes( router: APIRouter, sessionFactory, get_session, lookups: list) -> None:
+   for route in lookups:
+      router.add_api_route( route.path, _endpoint( route, sessionFactory, get_session), methods=[ "GET"], name=route.name)
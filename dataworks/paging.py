@@ -0,0 +1,111 @@
+##################################################################################################
+####                                                                                           ###
+####  keyset paging and column projection for the collection routes.  pages are ordered by    ###
+####  the primary key and the cursor carries the key of the last row sent, so each page is    ###
+####  a range scan rather than an offset.  projection is pushed into the select list          ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+##################################################################################################
+from sqlalchemy import select, and_, or_
+from bisect import bisect_right
+from typing import Union
+from utilities.exceptions import ApiException
+import base64
+import json
+import os
+
+# the largest page a caller may ask for
+maxPageSize = int( os.environ.get( "MaxPageSize", "1000"))
+
+# the response header carrying the cursor of the next page
+nextCursorHeader = "X-Next-Cursor"
+
+# true if the caller asked for a page rather than the whole list, a projection alone is not a page
+def wants_page( limit: Union[ int, None], cursor: Union[ str, None]) -> bool:
+   return limit is not None or cursor is not None
+
+def primary_key( model) -> list:
+   return list( model.__table__.primary_key.columns)
+
+# the columns to select, the primary key is always included so the next cursor can be built
+def project( model, fields: Union[ str, None]) -> list:
+   table = model.__table__
+   if not fields:
+      return list( table.columns)
+   wanted = { field.strip() for field in fields.split( ",") if field.strip()}
+   unknown = sorted( wanted - set( table.columns.keys()))
+   if unknown:
+      raise ApiException( status_code=400, code="invalid_fields", description=f"unknown fields: {', '.join( unknown)}")
+   # keep the table's column order so responses are stable
+   return [ column for column in table.columns if column.key in wanted or column.primary_key]
+
+# rows already in memory cut down to the projected columns, as they are when there are no fields
+def project_rows( model, rows: list, fields: Union[ str, None]) -> list:
+   if not fields:
+      return rows
+   names = [ column.key for column in project( model, fields)]
+   return [ { name: row[ name] for name in names} for row in rows]
+
+# the padding is dropped so the cursor can go in a query string as it is
+def encode_cursor( values) -> str:
+   return base64.urlsafe_b64encode( json.dumps( list( values)).encode()).decode().rstrip( "=")
+
+# decode a cursor back into typed primary key values
+def decode_cursor( model, cursor: Union[ str, None]):
+   if cursor is None:
+      return None
+   keys = primary_key( model)
+   try:
+      values = json.loads( base64.urlsafe_b64decode( cursor + "=" * ( -len( cursor) % 4)))
+      if len( values) != len( keys):
+         raise ValueError( cursor)
+      return tuple( key.type.python_type( value) for key, value in zip( keys, values))
+   except ( ValueError, TypeError):
+      raise ApiException( status_code=400, code="invalid_cursor", description="the cursor is not valid for this route")
+
+def page_size( limit: Union[ int, None]) -> int:
+   if limit is None:
+      return maxPageSize
+   return max( 1, min( limit, maxPageSize))
+
+# rows strictly after the given key in primary key order, written out as
+# ( a > x) or ( a = x and b > y) ... so it works without row value support
+def after_key( keys: list, values: tuple):
+   terms = []
+   for position, key in enumerate( keys):
+      equal = [ keys[ i] == values[ i] for i in range( position)]
+      terms.append( and_( *equal, key > values[ position]))
+   return or_( *terms)
+
+# run one keyset page against the database, returns the rows and the next cursor
+def keyset_page( session, model, filters: list, limit: Union[ int, None], cursor: Union[ str, None], fields: Union[ str, None]):
+   keys = primary_key( model)
+   size = page_size( limit)
+   stmt = select( *project( model, fields)).where( *filters)
+   after = decode_cursor( model, cursor)
+   if after is not None:
+      stmt = stmt.where( after_key( keys, after))
+   # fetch one extra row to learn whether there is a next page
+   rows = [ dict( row) for row in session.execute( stmt.order_by( *keys).limit( size + 1)).mappings()]
+   return trim_page( rows, keys, size)
+
+# page through rows already held in memory and sorted by primary key
+def slice_page( model, rows: list, sortKeys: list, limit: Union[ int, None], cursor: Union[ str, None], fields: Union[ str, None]):
+   keys = primary_key( model)
+   size = page_size( limit)
+   after = decode_cursor( model, cursor)
+   start = 0 if after is None else bisect_right( sortKeys, after)
+   page = project_rows( model, rows[ start:start + size + 1], fields)
+   return trim_page( page, keys, size)
+
+# hand the next cursor to the caller, no header means this was the last page
+def set_next_cursor( response, cursor: Union[ str, None]) -> None:
+   if cursor is not None:
+      response.headers[ nextCursorHeader] = cursor
+
+def trim_page( rows: list, keys: list, size: int):
+   if len( rows) <= size:
+      return rows, None
+   rows = rows[ :size]
+   return rows, encode_cursor( rows[ -1][ key.key] for key in keys)
@@ -0,0 +1,80 @@
+##################################################################################################
+####                                                                                           ###
+####  the query executor runs blocking sql alchemy work on a bounded thread pool so that the   ###
+####  async fast api handlers never stall the event loop while snowflake is busy               ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+####  20261018        single flight coalescing of identical concurrent queries                 ###
+####  20261018        admission against the warehouse gate                                     ###
+##################################################################################################
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# the number of worker threads allowed to run database work at the same time
+queryWorkers = int( os.environ.get( "QueryWorkers", "8"))
+
+# the shared pool used by every router handler
+queryExecutor = ThreadPoolExecutor( max_workers=queryWorkers, thread_name_prefix="query")
+
+# run a blocking callable on the query pool and await its result
+async def run_query( fn, *args, **kwargs):
+   # get the loop that is serving the current request
+   loop = asyncio.get_running_loop()
+   # hand the call to the pool and give the loop back to other requests while it runs
+   return await loop.run_in_executor( queryExecutor, partial( fn, *args, **kwargs))
+
+# run a blocking callable once the gate admits it, the gate turns the call away with a 503 when
+# the warehouse is saturated, no gate runs it straight away
+async def run_admitted( gate, fn, *args, **kwargs):
+   if gate is None:
+      return await run_query( fn, *args, **kwargs)
+   async with gate.admit():
+      return await run_query( fn, *args, **kwargs)
+
+# identical queries running right now, keyed by engine, query and parameters
+_inflight = {}
+
+# how many coalesced calls ran a query and how many shared one already in flight
+coalesceStats = { "executed": 0, "coalesced": 0}
+
+# collapse identical concurrent queries into one execution, turn off with QueryCoalescing=false
+queryCoalescing = os.environ.get( "QueryCoalescing", "true").lower() == "true"
+
+# run fn( session, *args, **kwargs) on its own session from the factory
+def _with_session( sessionFactory, fn, *args, **kwargs):
+   session = sessionFactory()
+   try:
+      return fn( session, *args, **kwargs)
+   finally:
+      session.close()
+
+# the query identity: the engine's session factory, the query method and its parameters
+def coalesce_key( sessionFactory, fn, args: tuple, kwargs: dict):
+   return ( sessionFactory, getattr( fn, "__qualname__", repr( fn)), args, tuple( sorted( kwargs.items())))
+
+# run fn( session, ...) once for every concurrent caller asking the same thing and share the result,
+# the query gets its own session so it outlives any one caller going away, callers must not
+# mutate the shared result.  only the one execution is admitted against the factory's gate
+async def run_coalesced( sessionFactory, fn, *args, **kwargs):
+   gate = getattr( sessionFactory, "gate", None)
+   if not queryCoalescing:
+      return await run_admitted( gate, _with_session, sessionFactory, fn, *args, **kwargs)
+   key = coalesce_key( sessionFactory, fn, args, kwargs)
+   pending = _inflight.get( key)
+   if pending is not None:
+      coalesceStats[ "coalesced"] += 1
+      # shield so one waiter being cancelled does not cancel the query for the others
+      return await asyncio.shield( pending)
+   # a task so callers arriving while it waits for the gate share it too
+   pending = asyncio.ensure_future( run_admitted( gate, _with_session, sessionFactory, fn, *args, **kwargs))
+   _inflight[ key] = pending
+   coalesceStats[ "executed"] += 1
+   # forget the query as soon as it finishes, whether or not this caller is still waiting
+   pending.add_done_callback( lambda _: _inflight.pop( key, None))
+   return await asyncio.shield( pending)
+
+def coalesce_stats() -> dict:
+   return dict( coalesceStats, inflight=len( _inflight))
@@ -0,0 +1,75 @@
+##################################################################################################
+####                                                                                           ###
+####  query metrics hook the engines so every statement records its time and rows, and every   ###
+####  pool checkout records how long it waited for a connection, into the shared registry      ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+##################################################################################################
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from utilities.metrics import metrics, rowBuckets
+import time
+
+metrics.describe( "db_query_duration_seconds", "Time from sending a statement to the cursor returning")
+metrics.describe( "db_query_rows", "Rows the cursor reported for each statement, where the driver reports it")
+metrics.describe( "db_query_errors_total", "Statements that raised")
+metrics.describe( "db_pool_checkout_seconds", "Time waiting for a pooled connection, including any new handshake")
+
+# engines that have been instrumented, by prefix, so their pools can be reported
+instrumentedEngines = {}
+
+# a queue pool that times each checkout, one subclass per engine so a recreated pool keeps its label
+def timed_pool( prefix: str):
+   class timedQueuePool( QueuePool):
+      def _do_get( self):
+         start = time.perf_counter()
+         try:
+            return super()._do_get()
+         finally:
+            metrics.observe( "db_pool_checkout_seconds", ( ( "engine", prefix),), time.perf_counter() - start)
+   timedQueuePool.__name__ = prefix + "QueuePool"
+   return timedQueuePool
+
+# the statement verb, e.g. select or insert, keeps the label set small
+def _verb( statement: str) -> str:
+   return statement.lstrip().split( None, 1)[ 0].lower() if statement.strip() else "unknown"
+
+# record the time and rows of every statement run on the engine
+def instrument_engine( engine, prefix: str):
+   labels = ( ( "engine", prefix),)
+
+   @event.listens_for( engine, "before_cursor_execute")
+   def before_cursor_execute( conn, cursor, statement, parameters, context, executemany):
+      # a stack because a statement can run another, e.g. a dialect's own lookups
+      conn.info.setdefault( "queryStart", []).append( time.perf_counter())
+
+   @event.listens_for( engine, "after_cursor_execute")
+   def after_cursor_execute( conn, cursor, statement, parameters, context, executemany):
+      elapsed = time.perf_counter() - conn.info[ "queryStart"].pop()
+      verbLabels = labels + ( ( "verb", _verb( statement)),)
+      metrics.observe( "db_query_duration_seconds", verbLabels, elapsed)
+      # drivers report -1 when they do not know the count before the rows are fetched
+      if cursor.rowcount is not None and cursor.rowcount >= 0:
+         metrics.observe( "db_query_rows", verbLabels, cursor.rowcount, rowBuckets)
+
+   @event.listens_for( engine, "handle_error")
+   def handle_error( context):
+      starts = context.connection.info.get( "queryStart") if context.connection is not None else None
+      if starts:
+         starts.pop()
+      metrics.inc( "db_query_errors_total", labels)
+
+   instrumentedEngines[ prefix] = engine
+   return engine
+
+# connections in use, idle and in overflow for each instrumented engine
+def pool_status() -> dict:
+   status = {}
+   for prefix, engine in instrumentedEngines.items():
+      pool = engine.pool
+      if isinstance( pool, QueuePool):
+         status[ prefix] = { "size": pool.size(), "checkedOut": pool.checkedout(), "idle": pool.checkedin(), "overflow": pool.overflow()}
+      else:
+         status[ prefix] = { "status": pool.status()}
+   return status
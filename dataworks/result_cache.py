@@ -0,0 +1,130 @@
+##################################################################################################
+####                                                                                           ###
+####  the result cache holds the rows of recent queries keyed by engine, compiled sql and bound ###
+####  parameters.  entries expire on a per table ttl and the least recently used are evicted   ###
+####  once the cache passes its byte budget.  tables can be invalidated explicitly            ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+####  20261018        prebuilt statements keyed without recompiling                            ###
+##################################################################################################
+from collections import OrderedDict
+from utilities.responses import dumps
+import threading
+import time
+import os
+
+# approximate bytes of rows to hold, measured as their encoded json size
+resultCacheBytes = int( os.environ.get( "ResultCacheBytes", str( 64 * 1024 * 1024)))
+
+# seconds a cached result lives unless its table has its own setting, e.g. ResultCacheTtl_product=300
+resultCacheTtl = float( os.environ.get( "ResultCacheTtl", "60"))
+
+def ttl_for( table: str) -> float:
+   return float( os.environ.get( "ResultCacheTtl_" + table, resultCacheTtl))
+
+# make bound parameter values hashable, expanding in (...) parameters arrive as lists
+def _freeze( value):
+   if isinstance( value, ( list, tuple)):
+      return tuple( _freeze( item) for item in value)
+   return value
+
+class queryResultCache :
+   def __init__( self, maxBytes: int = resultCacheBytes) -> None:
+      self._maxBytes = maxBytes
+      # key -> ( expiry, size, table, rows) in least recently used order
+      self._entries = OrderedDict()
+      # table -> keys so a table can be invalidated in one go
+      self._byTable = {}
+      # table -> version, bumped on every invalidation
+      self._versions = {}
+      self._bytes = 0
+      self._lock = threading.Lock()
+      self.stats = { "hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+   # the key of a statement on the engine behind the session, a prebuilt statement executed with
+   # separate parameters is its own identity so it is never compiled just to make a key
+   def key( self, session, stmt, params: dict = None):
+      engine = session.get_bind()
+      if params is not None:
+         return ( repr( engine.url), stmt, tuple( sorted( ( name, _freeze( value)) for name, value in params.items())))
+      compiled = stmt.compile( dialect=engine.dialect)
+      params = tuple( sorted( ( name, _freeze( value)) for name, value in compiled.params.items()))
+      return ( repr( engine.url), str( compiled), params)
+
+   def get( self, key):
+      with self._lock:
+         entry = self._entries.get( key)
+         if entry is None:
+            self.stats[ "misses"] += 1
+            return None
+         if entry[ 0] <= time.monotonic():
+            self._remove( key)
+            self.stats[ "expirations"] += 1
+            self.stats[ "misses"] += 1
+            return None
+         self._entries.move_to_end( key)
+         self.stats[ "hits"] += 1
+         return entry[ 3]
+
+   def put( self, key, table: str, rows: list, version: int) -> None:
+      size = len( dumps( rows))
+      # a result bigger than the whole budget would only evict everything else
+      if size > self._maxBytes or ttl_for( table) <= 0:
+         return
+      with self._lock:
+         # the table was invalidated while this query ran, so the rows may already be stale
+         if self._versions.get( table, 0) != version:
+            return
+         if key in self._entries:
+            self._remove( key)
+         self._entries[ key] = ( time.monotonic() + ttl_for( table), size, table, rows)
+         self._byTable.setdefault( table, set()).add( key)
+         self._bytes += size
+         while self._bytes > self._maxBytes:
+            oldest = next( iter( self._entries))
+            self._remove( oldest)
+            self.stats[ "evictions"] += 1
+
+   # run a select through the cache, returning its rows as dictionaries
+   def rows( self, session, stmt, table: str, params: dict = None) -> list:
+      key = self.key( session, stmt, params)
+      rows = self.get( key)
+      if rows is None:
+         version = self.version( table)
+         rows = [ dict( row) for row in session.execute( stmt, params).mappings()]
+         self.put( key, table, rows, version)
+      return rows
+
+   # drop every cached result for a table
+   def invalidate( self, table: str) -> int:
+      with self._lock:
+         self._versions[ table] = self._versions.get( table, 0) + 1
+         keys = self._byTable.pop( table, set())
+         for key in keys:
+            self._remove( key)
+         self.stats[ "invalidations"] += 1
+         return len( keys)
+
+   def clear( self) -> None:
+      for table in list( self._byTable):
+         self.invalidate( table)
+
+   def version( self, table: str) -> int:
+      return self._versions.get( table, 0)
+
+   def _remove( self, key) -> None:
+      _, size, table, _ = self._entries.pop( key)
+      self._bytes -= size
+      keys = self._byTable.get( table)
+      if keys is not None:
+         keys.discard( key)
+         if not keys:
+            del self._byTable[ table]
+
+   def report( self) -> dict:
+      with self._lock:
+         return dict( self.stats, entries=len( self._entries), bytes=self._bytes, maxBytes=self._maxBytes)
+
+# one cache shared by both engines, the engine url is part of every key
+resultCache = queryResultCache()
@@ -0,0 +1,54 @@
+##################################################################################################
+####                                                                                           ###
+####  shared row serialisation for the persistent base classes.  the column list of each      ###
+####  mapped class is compiled into a single attribute getter the first time it is needed,    ###
+####  rather than walking the mapper with inspect() for every row                             ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+####  20261018        core rows can go through the shared result cache                         ###
+##################################################################################################
+from sqlalchemy import inspect, select
+from operator import attrgetter
+from typing import Union
+from dataworks.result_cache import resultCache
+from dataworks.paging import project
+
+class RowSerializable :
+   # compile the column keys and a getter that reads them all in one call
+   @classmethod
+   def _row_accessor( cls):
+      # look on the class itself so a subclass never reuses its parent's accessor
+      accessor = cls.__dict__.get( "_rowAccessor")
+      if accessor is None:
+         keys = tuple( c.key for c in inspect( cls).column_attrs)
+         getter = attrgetter( *keys)
+         # attrgetter with one name returns the bare value rather than a tuple
+         if len( keys) == 1:
+            getter = lambda row, single=getter: ( single( row),)
+         accessor = ( keys, getter)
+         setattr( cls, "_rowAccessor", accessor)
+      return accessor
+
+   # return properties as a dictionary
+   def _asdict( self):
+      keys, getter = self._row_accessor()
+      return dict( zip( keys, getter( self)))
+
+   # select plain core rows as dictionaries, skipping orm object hydration altogether,
+   # through the shared result cache when cache is set and projected onto fields when given
+   @classmethod
+   def _select_rows( cls, session, *filters, cache: bool = False, fields: Union[ str, None] = None) -> list:
+      stmt = select( *project( cls, fields)).where( *filters)
+      if cache:
+         return resultCache.rows( session, stmt, cls.__tablename__)
+      return [ dict( row) for row in session.execute( stmt).mappings()]
+
+   # query the class with optional filters, as core row dictionaries when core is set,
+   # only core rows are cached or projected because orm objects belong to the session that
+   # loaded them and always carry every column
+   @classmethod
+   def _fetch( cls, session, *filters, core: bool = False, cache: bool = False, fields: Union[ str, None] = None) -> list:
+      if core:
+         return cls._select_rows( session, *filters, cache=cache, fields=fields)
+      return session.query( cls).filter( *filters).all()
@@ -0,0 +1,155 @@
+##################################################################################################
+####                                                                                           ###
+####  the session factory builds pooled engines from environment settings, hands each request  ###
+####  its own session through a fast api dependency and can pre-warm the pool on cold start   ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+####  20261018        lazy engines built on first use or in the background                     ###
+####  20261018        query and pool checkout metrics on every engine                          ###
+####  20261018        stand in engines for benchmarks                                          ###
+####  20261018        admission gate per warehouse                                             ###
+##################################################################################################
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from utilities.startup_timing import startupTimer
+from dataworks.query_metrics import instrument_engine, timed_pool
+from utilities.admission import AdmissionGate
+import logging
+import threading
+import os
+
+logger = logging.getLogger( __name__)
+
+# read the pool settings for an engine, e.g. SnowflakePoolSize or CapricePoolSize
+def pool_options( prefix: str) -> dict:
+   return {
+      # connections held open in the pool
+      "pool_size": int( os.environ.get( prefix + "PoolSize", "5")),
+      # extra connections allowed above the pool size under a burst
+      "max_overflow": int( os.environ.get( prefix + "MaxOverflow", "10")),
+      # seconds before a pooled connection is replaced, -1 never recycles
+      "pool_recycle": int( os.environ.get( prefix + "PoolRecycle", "3600")),
+      # test each connection on checkout, costs a round trip so it is off by default
+      "pool_pre_ping": os.environ.get( prefix + "PoolPrePing", "false").lower() == "true",
+   }
+
+# the admission gate in front of an engine's warehouse, e.g. SnowflakeMaxQueries or CapriceMaxQueries
+def admission_gate( prefix: str) -> AdmissionGate:
+   return AdmissionGate(
+      name = prefix.lower(),
+      # queries allowed to run against the warehouse at once, 0 admits everything
+      limit = int( os.environ.get( prefix + "MaxQueries", "8")),
+      # queries allowed to wait for a slot before new ones are turned away
+      queue_depth = int( os.environ.get( prefix + "QueryQueueDepth", "32")),
+      # seconds a query may wait for a slot before its request gets a 503
+      deadline = float( os.environ.get( prefix + "QueryDeadlineSeconds", "5")),
+      retry_after = int( os.environ.get( prefix + "QueryRetryAfter", "1"))
+   )
+
+# create an engine using the pool settings for the given prefix, timing its queries and checkouts,
+# any other create_engine arguments are passed through
+def build_engine( url, prefix: str, **kwargs):
+   engine = create_engine( url, poolclass=timed_pool( prefix), **pool_options( prefix), **kwargs)
+   return instrument_engine( engine, prefix)
+
+# holds the recipe for an engine and only builds it the first time it is asked for
+class lazyEngine :
+   def __init__( self, build, prefix: str) -> None:
+      self._build = build
+      self._prefix = prefix
+      self._engine = None
+      self._lock = threading.Lock()
+
+   @property
+   def built( self) -> bool:
+      return self._engine is not None
+
+   def get( self):
+      if self._engine is None:
+         with self._lock:
+            # only the first caller builds, anyone racing it waits and shares the result
+            if self._engine is None:
+               with startupTimer.measure( "engine " + self._prefix):
+                  self._engine = self._build()
+      return self._engine
+
+   # serve a ready made engine instead of building one, e.g. a local stand in for benchmarks
+   def use( self, engine) -> None:
+      with self._lock:
+         self._engine = engine
+
+# a session maker that binds to its lazy engine the first time a session is made, carrying the
+# admission gate of that engine so queries run through the factory can be admitted against it
+class lazySessionFactory :
+   def __init__( self, engineSource: lazyEngine, gate: AdmissionGate = None) -> None:
+      self._engineSource = engineSource
+      self.gate = gate
+      self._factory = sessionmaker()
+      self._bound = False
+
+   def __call__( self, **kwargs):
+      if not self._bound:
+         self._factory.configure( bind=self._engineSource.get())
+         self._bound = True
+      return self._factory( **kwargs)
+
+   # pass configuration through, binding explicitly replaces the lazy engine
+   def configure( self, **kwargs):
+      self._factory.configure( **kwargs)
+      if "bind" in kwargs:
+         self._bound = True
+
+# open a number of connections at once and hand them back to the pool
+def prewarm( engine, connections: int):
+   opened = []
+   lock = threading.Lock()
+
+   def connect():
+      # pay the handshake now rather than on a user's request
+      try:
+         connection = engine.connect()
+      except Exception as ex:
+         # a failed warm up only costs the first request its handshake
+         logger.warning( "connection pre-warm failed: %s", ex)
+         return
+      with lock:
+         opened.append( connection)
+
+   # connect in parallel so the warm up takes one handshake rather than n
+   threads = [ threading.Thread( target=connect) for _ in range( connections)]
+   for thread in threads:
+      thread.start()
+   for thread in threads:
+      thread.join()
+   # closing returns each connection to the pool still open
+   for connection in opened:
+      connection.close()
+   return len( opened)
+
+# build the engine off the request path and pre-warm it if the prefix asks, e.g. SnowflakePrewarm=4
+def warm_in_background( engineSource: lazyEngine, prefix: str):
+   connections = int( os.environ.get( prefix + "Prewarm", "0"))
+   def warm():
+      try:
+         engine = engineSource.get()
+      except Exception as ex:
+         # the first query will try again and surface the error to its caller
+         logger.warning( "%s engine build failed: %s", prefix, ex)
+         return
+      if connections > 0:
+         prewarm( engine, connections)
+   thread = threading.Thread( target=warm, name=prefix + "-warm", daemon=True)
+   thread.start()
+   return thread
+
+# build a fast api dependency that gives each request its own session
+def session_dependency( factory):
+   def get_session():
+      session = factory()
+      try:
+         yield session
+      finally:
+         # return the connection to the pool once the request is finished
+         session.close()
+   return get_session
@@ -0,0 +1,94 @@
+##################################################################################################
+####                                                                                           ###
+####  the snapshot store keeps a copy of a catalog snapshot in a local sqlite file so a new    ###
+####  instance can serve its dimension tables straight away without waiting on the warehouse.  ###
+####  files are written to a temporary name and renamed over the old one so a reader never    ###
+####  sees half a file, and are read through sqlite's memory map                              ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+##################################################################################################
+from sqlalchemy import create_engine, event, select, insert, MetaData, Table, Column, String, Float, Integer
+from sqlalchemy.pool import NullPool
+from typing import Union
+import os
+import tempfile
+
+# directory the snapshot files live in, unset turns the durable snapshots off.  point it at storage
+# that outlives the instance, e.g. /home/data/snapshots on an app service plan
+snapshotDirectory = os.environ.get( "SnapshotDirectory")
+
+# bytes of each file sqlite may map into memory instead of reading through the page cache
+snapshotMmapBytes = int( os.environ.get( "SnapshotMmapBytes", str( 256 * 1024 * 1024)))
+
+# bumped whenever the layout of the file changes, older files are ignored
+snapshotFormat = 1
+
+class snapshotStore :
+   def __init__( self, model, path: str) -> None:
+      self._model = model
+      self.path = path
+
+   # the model's table without its warehouse schema, plus a one row table describing the file
+   def _tables( self):
+      metadata = MetaData()
+      rows = self._model.__table__.to_metadata( metadata, schema=None)
+      meta = Table( "snapshot_meta", metadata,
+         Column( "format", Integer),
+         Column( "tablename", String),
+         Column( "loaded_at", Float))
+      return metadata, rows, meta
+
+   def _engine( self, path: str):
+      engine = create_engine( "sqlite:///" + path, poolclass=NullPool)
+      @event.listens_for( engine, "connect")
+      def connect( connection, record):
+         connection.execute( f"PRAGMA mmap_size = {snapshotMmapBytes}")
+      return engine
+
+   # write the rows to a new file and swap it in place of the old one
+   def save( self, rows: list, loadedAt: float) -> None:
+      directory = os.path.dirname( self.path)
+      os.makedirs( directory, exist_ok=True)
+      # a fresh name for every save, so two instances sharing a directory or a refresh and a stale
+      # reload in the same process never write the same file.  sqlite takes the empty file as a
+      # new database
+      handle, temporary = tempfile.mkstemp( dir=directory, prefix=os.path.basename( self.path) + ".", suffix=".tmp")
+      os.close( handle)
+      try:
+         metadata, table, meta = self._tables()
+         engine = self._engine( temporary)
+         try:
+            with engine.begin() as connection:
+               metadata.create_all( connection)
+               if rows:
+                  connection.execute( insert( table), rows)
+               connection.execute( insert( meta), { "format": snapshotFormat, "tablename": self._model.__tablename__, "loaded_at": loadedAt})
+         finally:
+            engine.dispose()
+         os.replace( temporary, self.path)
+      except BaseException:
+         os.remove( temporary)
+         raise
+
+   # the rows and the time they were loaded from the warehouse, None if there is no usable file
+   def read( self) -> Union[ tuple, None]:
+      if not os.path.exists( self.path):
+         return None
+      metadata, table, meta = self._tables()
+      engine = self._engine( self.path)
+      try:
+         with engine.connect() as connection:
+            about = connection.execute( select( meta)).mappings().first()
+            if about is None or about[ "format"] != snapshotFormat or about[ "tablename"] != self._model.__tablename__:
+               return None
+            rows = [ dict( row) for row in connection.execute( select( table)).mappings()]
+      finally:
+         engine.dispose()
+      return rows, about[ "loaded_at"]
+
+# the store for a model's snapshot, None when no snapshot directory is configured
+def snapshot_store( model) -> Union[ snapshotStore, None]:
+   if not snapshotDirectory:
+      return None
+   return snapshotStore( model, os.path.join( snapshotDirectory, model.__tablename__ + ".sqlite"))
@@ -0,0 +1,97 @@
+##################################################################################################
+####                                                                                           ###
+####  streaming responses: rows are fetched from a server side cursor in batches and written   ###
+####  to the socket as newline delimited json, so memory stays at one batch however many rows  ###
+####  the query returns                                                                        ###
+####                                                                                           ###
+####  date      by    action                                                                   ###
+####  20261018        Created                                                                  ###
+####  20261018        streams hold a warehouse admission slot                                  ###
+##################################################################################################
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from typing import Union
+from dataworks.query_executor import run_query
+from dataworks.paging import primary_key, project
+from utilities.responses import dumps
+import asyncio
+import weakref
+import os
+
+ndjsonMediaType = "application/x-ndjson"
+
+# rows fetched from the cursor and written to the socket per batch
+streamBatchSize = int( os.environ.get( "StreamBatchSize", "1000"))
+
+# stream if the caller sent Accept: application/x-ndjson or ?stream=true
+def wants_stream( request: Request, stream: bool) -> bool:
+   return stream or ndjsonMediaType in request.headers.get( "accept", "")
+
+# one json document per line
+def encode_lines( rows) -> bytes:
+   return b"".join( dumps( dict( row)) + b"\n" for row in rows)
+
+# yield batches of rows from a server side cursor, the generator owns its session because
+# the request's session is closed before the response body is sent
+def fetch_batches( sessionFactory, stmt, batchSize: int = streamBatchSize):
+   session = sessionFactory()
+   try:
+      result = session.execute( stmt.execution_options( stream_results=True, yield_per=batchSize))
+      for batch in result.mappings().partitions():
+         yield batch
+   finally:
+      session.close()
+
+# pull and encode the next batch, run on the query pool so the loop only writes bytes
+def _next_chunk( batches, encode):
+   batch = next( batches, None)
+   return None if batch is None else encode( batch)
+
+async def _stream_batches( batches, release=None, encode=encode_lines):
+   try:
+      while True:
+         chunk = await run_query( _next_chunk, batches, encode)
+         if chunk is None:
+            break
+         yield chunk
+   finally:
+      # release the cursor and the session even if the client went away mid stream
+      await run_query( batches.close)
+      if release is not None:
+         release()
+
+async def _stream_rows( rows: list, names: Union[ list, None], batchSize: int):
+   for start in range( 0, len( rows), batchSize):
+      batch = rows[ start:start + batchSize]
+      if names is not None:
+         batch = [ { name: row[ name] for name in names} for row in batch]
+      yield encode_lines( batch)
+
+# stream batches from a generator that owns its session, each one encoded on the query pool.  the
+# stream holds a slot on the factory's gate from before the headers go out until its cursor is closed
+async def stream_batches( sessionFactory, batches, mediaType: str, encode=encode_lines, headers: dict = None) -> StreamingResponse:
+   gate = getattr( sessionFactory, "gate", None)
+   if gate is None:
+      return StreamingResponse( _stream_batches( batches, encode=encode), media_type=mediaType, headers=headers)
+   try:
+      release = await gate.acquire()
+   except BaseException:
+      # the generator never started so closing it only marks it finished
+      batches.close()
+      raise
+   body = _stream_batches( batches, release, encode)
+   # a response dropped before its body is read never runs the generator's finally
+   loop = asyncio.get_running_loop()
+   weakref.finalize( body, loop.call_soon_threadsafe, release)
+   return StreamingResponse( body, media_type=mediaType, headers=headers)
+
+# stream a model query as ndjson, optionally projected onto the named fields
+async def stream_query( sessionFactory, model, filters: list, fields: Union[ str, None] = None) -> StreamingResponse:
+   stmt = select( *project( model, fields)).where( *filters).order_by( *primary_key( model))
+   return await stream_batches( sessionFactory, fetch_batches( sessionFactory, stmt), ndjsonMediaType)
+
+# stream rows already held in memory, such as a catalog snapshot
+def stream_rows( model, rows: list, fields: Union[ str, None] = None) -> StreamingResponse:
+   names = [ column.key for column in project( model, fields)] if fields else None
+   return StreamingResponse( _stream_rows( rows, names, streamBatchSize), media_type=ndjsonMediaType)
@@ -7,15 +7,49 @@
 ####  date      by    action                                                                   ### 
 ####  20230911  AJT   created                                                                  ###
 ####  20230913  AJT   moved user elements from main and user new base classes                  ###
+####  20261018        hash indexed user directory with background refresh                      ###
+####  20261018        bounded pool for password verification                                   ###
+####  20261018        background first load with readiness gating, lazy passlib                ###
 ##################################################################################################
-from sqlalchemy import inspect
 from sqlalchemy import Column, String, Boolean
 from dataworks.global_engine import ControlPersistent, globalSession, BusinessValidated
 from typing import Union
-from passlib.context import CryptContext
+from utilities.bounded_pool import BoundedPool
+from utilities.exceptions import OverloadedException
+from utilities.startup_timing import startupTimer
+import asyncio
+import logging
+import threading
 import os
 
-pwd_context = CryptContext( schemes=[ "bcrypt"], deprecated="auto")    
+logger = logging.getLogger( __name__)
+
+# the password context is built on first use to keep passlib out of the cold start
+_pwdContext = None
+_pwdLock = threading.Lock()
+
+def get_pwd_context():
+   global _pwdContext
+   if _pwdContext is None:
+      with _pwdLock:
+         if _pwdContext is None:
+            from passlib.context import CryptContext
+            _pwdContext = CryptContext( schemes=[ "bcrypt"], deprecated="auto")
+   return _pwdContext
+
+# keep pwd_context as a module attribute, building the context the first time it is read
+def __getattr__( name):
+   if name == "pwd_context":
+      return get_pwd_context()
+   raise AttributeError( f"module {__name__!r} has no attribute {name!r}")
+
+# bcrypt takes 100ms+ of cpu per check so it runs on its own small pool, bcrypt drops the
+# gil while hashing so threads are enough.  once the queue is full logins get a 503
+passwordPool = BoundedPool(
+   name = "password",
+   workers = int( os.environ.get( "PasswordWorkers", "2")),
+   queue_depth = int( os.environ.get( "PasswordQueueDepth", "16"))
+)
 
 # derive the user control class from the base class and link to the db table
 class user_control( ControlPersistent):
@@ -34,37 +68,126 @@ class user_control( ControlPersistent):
    def __repr__(self):
       return f"login(username={self.username!r}, full_name={self.full_name!r}, email={self.email!r}"  
 
-   # return properties as a dictionary
-   def _asdict( self):
-      return { c.key: getattr( self, c.key)
-         for c in inspect( self).mapper.column_attrs}  
 
-# define a wrapper class that will surface the data as a dictionary
+# seconds between background refreshes of the user directory, 0 turns refreshing off
+userRefreshSeconds = float( os.environ.get( "UserRefreshSeconds", "60"))
+
+# seconds a request will wait for the first load of the directory before getting a 503
+userReadyWaitSeconds = float( os.environ.get( "UserReadyWaitSeconds", "10"))
+
+# define a wrapper class that holds the users in a directory keyed by user name
 class userLogins :
-   def __init__( self) -> None:
-      # load all of the users from the user control database
-      self._userQry = globalSession.query( user_control).all()
-      # build the local dictionary
+   def __init__( self, load: bool = True) -> None:
+      # prebuilt users keyed by user name so a lookup is a single hash probe
       self._users = {}
-      # iterate through the users
-      for user in self._userQry :
-         # add an entry into the dictionary for each user
-         self._users[ user.username] = user._asdict()
-      
+      # the column values each user was built from, used to spot changed rows
+      self._rows = {}
+      # background refresh state
+      self._refresher = None
+      self._stopRefresh = threading.Event()
+      # callbacks told which user names changed on each refresh
+      self._listeners = []
+      # set once the first load has succeeded
+      self._ready = threading.Event()
+      # load all of the users from the user control database, unless start_loading will
+      if load:
+         self.refresh()
+
+   # read every user row as a dictionary keyed by user name
+   def _load( self):
+      rows = globalSession.query( user_control).all()
+      # hand the connection back to the pool, the rows stay loaded
+      globalSession.remove()
+      return { row.username: row._asdict() for row in rows}
+
+   # reload the table and apply only the rows that changed, returns the affected user names
+   def refresh( self):
+      latest = self._load()
+      # find the added or altered rows and the rows that have gone
+      changed = [ name for name, row in latest.items() if self._rows.get( name) != row]
+      removed = [ name for name in self._rows if name not in latest]
+      # if nothing moved then keep the current directory, an empty first load still counts as ready
+      if not changed and not removed:
+         self._ready.set()
+         return []
+      # copy the directory so readers never see a half applied refresh
+      users = dict( self._users)
+      for name in changed:
+         users[ name] = UserInDB( **latest[ name])
+      for name in removed:
+         del users[ name]
+      # swap the new directory in
+      self._users = users
+      self._rows = latest
+      # only now can a request find every user, so waiting requests are let through here
+      self._ready.set()
+      # tell anything holding per user state, such as the token cache
+      for listener in self._listeners:
+         listener( changed + removed)
+      return changed + removed
+
+   # register a callback that receives the user names affected by each refresh
+   def add_listener( self, callback):
+      self._listeners.append( callback)
+
+   # refresh the directory every interval seconds on a daemon thread
+   def start_refresh( self, interval: float = userRefreshSeconds):
+      if interval <= 0 or self._refresher is not None:
+         return
+      def run():
+         while not self._stopRefresh.wait( interval):
+            try:
+               self.refresh()
+            except Exception as ex:
+               # keep serving the last good directory and try again next interval
+               logger.warning( "user directory refresh failed: %s", ex)
+      self._refresher = threading.Thread( target=run, name="user-refresh", daemon=True)
+      self._refresher.start()
+
+   def stop_refresh( self):
+      self._stopRefresh.set()
+
+   # do the first load on a daemon thread, retrying until it works, then keep refreshing
+   def start_loading( self, retry: float = 5):
+      def run():
+         while not self._stopRefresh.is_set():
+            try:
+               with startupTimer.measure( "user directory"):
+                  self.refresh()
+               break
+            except Exception as ex:
+               logger.warning( "user directory load failed, retrying: %s", ex)
+               self._stopRefresh.wait( retry)
+         self.start_refresh()
+      threading.Thread( target=run, name="user-load", daemon=True).start()
+
+   @property
+   def ready( self) -> bool:
+      return self._ready.is_set()
+
+   # wait without blocking the loop for the first load, then fail fast with a 503
+   async def wait_ready( self, timeout: float = userReadyWaitSeconds):
+      if self._ready.is_set():
+         return
+      loop = asyncio.get_running_loop()
+      deadline = loop.time() + timeout
+      while not self._ready.is_set():
+         if loop.time() >= deadline:
+            raise OverloadedException( code="user_directory_starting", description="The service is starting, please retry shortly")
+         await asyncio.sleep( 0.05)
+
    # return the completed dictionary
    def get_users( self):
-      return self._users  
+      return self._rows  
    
    def get_user( self, username: str):
-      for user in self._userQry :
-         # if this is the required user
-         if user.username == username :
-            # return a pointer to the dictionary value of the user
-            return UserInDB( **user._asdict())   
+      # return the prebuilt user, or None if there is no such user
+      return self._users.get( username)
 
    def authenticate_user( self, username: str, password: str):
       user = self.get_user( username)
-      if not user:
+      # a disabled user can't log in, and isn't worth a bcrypt check
+      if not user or not user.enabled:
          return False
       if not user.verify_password( password):
          return False
@@ -82,10 +205,10 @@ class UserInDB( User):
    hashed_password: str
 
    def verify_password( self, plain_password):
-      return pwd_context.verify( plain_password, self.hashed_password)
+      return get_pwd_context().verify( plain_password, self.hashed_password)
 
    def get_password_hash( self, password):
-      return pwd_context.hash( password)
+      return get_pwd_context().hash( password)
 
 
 
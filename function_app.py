@@ -1,8 +1,14 @@
+from utilities.startup_timing import startupTimer
+
+# time the heavy imports one by one so the startup report shows where a cold start goes
+startupTimer.import_modules( [ "azure.functions", "sqlalchemy.orm", "fastapi", "api.app_builder"])
+
 import azure.functions as func  
 from api.app_builder import build_app
 
 # build the fast api app
-fastapi_app = build_app()
+with startupTimer.measure( "build_app"):
+   fastapi_app = build_app()
 
 # return using an ASGI funtion app wrapper
 app = func.AsgiFunctionApp(app=fastapi_app, http_auth_level=func.AuthLevel.ANONYMOUS)
@@ -1,5 +1,17 @@
-from businessObjects.caprice import product
-from fastapi import APIRouter
+from businessObjects.caprice import product, productCatalog
+from dataworks.query_executor import run_admitted, run_coalesced
+from utilities.responses import FastJSONResponse
+from utilities.conditional import version_etag, etag_matches, not_modified, versioned_json, conditional_json
+from dataworks.caprice_engine import get_session, globalSessionFactory, warehouseGate
+from sqlalchemy.orm import Session
+from dataworks.paging import wants_page, keyset_page, set_next_cursor, project_rows
+from dataworks.streaming import wants_stream, stream_query, stream_rows
+from dataworks.batching import fetch_grouped, unique_keys
+from dataworks.columnar import export_query
+from dataworks.lookup_routes import lookupRoute, add_lookup_routes
+from pydantic import BaseModel
+from fastapi import APIRouter, Depends, Request
+from typing import List, Union
 
 router = APIRouter(
     prefix="/caprice",
@@ -9,32 +21,60 @@ router = APIRouter(
 
 fake_items_db = {"plumbus": {"name": "Plumbus"}, "gun": {"name": "Portal Gun"}}
 
+class productBatch( BaseModel):
+   ids: List[ int]
+
 @router.get("/product")
-async def read_items():
+async def read_items( request: Request, live: bool = False, stream: bool = False, limit: Union[ int, None] = None, cursor: Union[ str, None] = None, fields: Union[ str, None] = None, session: Session = Depends( get_session)):
+   # a live stream comes straight from a server side cursor
+   if live and wants_stream( request, stream):
+      return await stream_query( globalSessionFactory, product, [], fields)
+   # serve from the catalog snapshot unless the caller asks for a live query
+   if not live:
+      await productCatalog.ready()
+      if wants_stream( request, stream):
+         return stream_rows( product, productCatalog.all(), fields)
+      # the snapshot version alone proves whether the client's copy is still current
+      etag = version_etag( productCatalog.version, request)
+      if etag_matches( request, etag):
+         return not_modified( etag)
+      if not wants_page( limit, cursor):
+         return versioned_json( project_rows( product, productCatalog.all(), fields), etag)
+      Products, nextCursor = productCatalog.page( limit, cursor, fields)
+      Result = versioned_json( Products, etag)
+      set_next_cursor( Result, nextCursor)
+      return Result
+   # a live page pushes the key range and the projection down into snowflake
+   if wants_page( limit, cursor):
+      Products, nextCursor = await run_admitted( warehouseGate, keyset_page, session, product, [], limit, cursor, fields)
+      Result = conditional_json( request, Products)
+      set_next_cursor( Result, nextCursor)
+      return Result
    #Products = globalSession.query( product).all()
-   Products = product().all
+   Products = await run_coalesced( globalSessionFactory, product().all, core=True, fields=fields)
    
-   return Products
+   return conditional_json( request, Products)
 
-@router.get("/product/{product_id}")
-async def read_item( product_id: str):
-   #Products = globalSession.query( product).filter( product.productid == product_id).all()
-   Products = product().byProductId( product_id=product_id)
-   
-   return [ eachProduct._asdict() for eachProduct in Products]
+@router.get("/product:export")
+async def export_products( request: Request, format: Union[ str, None] = None, fields: Union[ str, None] = None):
+   # the whole table for dataframe loads, as arrow ipc or parquet straight from snowflake's arrow batches
+   return await export_query( globalSessionFactory, product, [], request, format, fields)
 
-@router.get("/product/measure/{measure}")
-async def read_item( measure: str):
-   #Products = globalSession.query( product).filter( product.measure == measure).all()
-   Products = product().byMeasure( measure=measure)
-   
-   return [ eachProduct._asdict() for eachProduct in Products]
+# the keyed lookups, served from the catalog snapshot unless live, each endpoint generated with its
+# statement built once
+add_lookup_routes( router, globalSessionFactory, get_session, [
+   lookupRoute( "/product/{product_id}", product, [ product.productid], catalog=productCatalog, stream=True),
+   lookupRoute( "/product/measure/{measure}", product, [ product.measure], catalog=productCatalog, stream=True),
+   lookupRoute( "/product/salescategory/{salescategory}", product, [ product.salescategory], catalog=productCatalog, stream=True),
+])
 
+@router.post("/product:batch")
+async def read_item_batch( batch: productBatch, live: bool = False, session: Session = Depends( get_session)):
+   # many product ids in one call, answered from the catalog snapshot unless asked to go live
+   if not live:
+      await productCatalog.ready()
+      return FastJSONResponse( { productId: productCatalog.lookup( "productid", productId) for productId in unique_keys( batch.ids)})
+   # one in (...) query per chunk of ids, grouped back by product id
+   Products = await run_admitted( warehouseGate, fetch_grouped, session, product, product.productid, batch.ids)
 
-@router.get("/product/salescategory/{salescategory}")
-async def read_item( salescategory: str):
-   #Products = globalSession.query( product).filter( product.salescategory == salescategory).all()
-   Products = product().bySalesCategory( salescategory=salescategory)
-   
-   return [ eachProduct._asdict() for eachProduct in Products]
-
+   return FastJSONResponse( Products)
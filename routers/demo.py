@@ -1,10 +1,22 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, Request
+from typing import List, Union
 from sqlalchemy import Column
 from sqlalchemy import String
 from sqlalchemy import Integer
 from sqlalchemy import select
-from sqlalchemy import inspect
-from dataworks.global_engine import BusinessPersistent, globalSession
+from sqlalchemy.orm import Session
+from dataworks.global_engine import BusinessPersistent, get_session, globalSessionFactory, warehouseGate
+from dataworks.query_executor import run_admitted, run_coalesced
+from utilities.responses import FastJSONResponse
+from dataworks.paging import wants_page, keyset_page, set_next_cursor, project_rows
+from dataworks.batching import fetch_grouped
+from dataworks.columnar import export_query
+from dataworks.lookup_routes import lookupRoute, add_lookup_routes
+from dataworks.catalog import catalogSnapshot
+from dataworks.snapshot_store import snapshot_store, snapshotDirectory
+from utilities.conditional import conditional_json, version_etag, etag_matches, not_modified, versioned_json
+import os
+from pydantic import BaseModel
 
 class student( BusinessPersistent):
    __tablename__ = "dim_student"
@@ -22,10 +34,25 @@ class student( BusinessPersistent):
    def __repr__(self):
       return f"student(id={self.personid!r}, name={self.fullname!r}, email={self.email!r}"  
 
-   def _asdict( self):
-      return { c.key: getattr( self, c.key)
-         for c in inspect( self).mapper.column_attrs}     
-      
+   # the query methods return orm objects, or plain row dictionaries when core is set,
+   # core rows go through the shared result cache when cache is set and keep only fields when given
+   def all( self, session: Session, core: bool = False, cache: bool = False, fields: Union[ str, None] = None) :
+      return student._fetch( session, core=core, cache=cache, fields=fields)
+
+# the student dimension is read mostly so the routes can serve it from memory like the product
+# catalog.  that answers from a snapshot up to a refresh interval old, so it is on by default only
+# with durable snapshots, StudentCatalog=true or false sets it either way
+studentCatalogEnabled = os.environ.get( "StudentCatalog", "true" if snapshotDirectory else "false").lower() == "true"
+
+studentCatalog = catalogSnapshot(
+   student,
+   globalSessionFactory,
+   indexes = [ "personid"],
+   interval = float( os.environ.get( "StudentCatalogRefreshSeconds", "300")),
+   store = snapshot_store( student),
+   maxAge = float( os.environ.get( "StudentSnapshotMaxAgeSeconds", "86400"))
+) if studentCatalogEnabled else None
+
 class student_schedule( BusinessPersistent):
    __tablename__ = "student_schedule"
    __table_args__ = { 'schema': 'canon.prod'}
@@ -41,10 +68,9 @@ class student_schedule( BusinessPersistent):
 
    def __repr__(self):
       return f"student_schedule(id={self.courseid!r}, time={self.course_time!r}, location={self.location!r}, instructor={self.instructorname!r}, studentemail={self.email!r}"  
-   
-   def _asdict( self):
-      return { c.key: getattr( self, c.key)
-         for c in inspect( self).mapper.column_attrs}     
+
+class studentBatch( BaseModel):
+   ids: List[ str]
 
 router = APIRouter(
     prefix="/assured",
@@ -53,37 +79,47 @@ router = APIRouter(
 )
 
 @router.get("/student")
-async def get_students():
-   Students = globalSession.query(student).all()
+async def get_students( request: Request, live: bool = False, limit: Union[ int, None] = None, cursor: Union[ str, None] = None, fields: Union[ str, None] = None, session: Session = Depends( get_session)):
+   # serve from the catalog snapshot, when there is one, unless the caller asks for a live query
+   if studentCatalog is not None and not live:
+      await studentCatalog.ready()
+      etag = version_etag( studentCatalog.version, request)
+      if etag_matches( request, etag):
+         return not_modified( etag)
+      if not wants_page( limit, cursor):
+         return versioned_json( project_rows( student, studentCatalog.all(), fields), etag)
+      Students, nextCursor = studentCatalog.page( limit, cursor, fields)
+      Result = versioned_json( Students, etag)
+      set_next_cursor( Result, nextCursor)
+      return Result
+   # a page runs as a keyset range scan over the primary key
+   if wants_page( limit, cursor):
+      Students, nextCursor = await run_admitted( warehouseGate, keyset_page, session, student, [], limit, cursor, fields)
+      Result = conditional_json( request, Students)
+      set_next_cursor( Result, nextCursor)
+      return Result
+   # live means fresh from the warehouse, so only the catalog-less default goes through the result cache
+   Students = await run_coalesced( globalSessionFactory, student().all, core=True, cache=not live, fields=fields)
 
-   return Students   
-   
-@router.get("/student/{student_id}")
-async def get_student( student_id: str):
-   Students = globalSession.query( student).filter( student.personid == student_id).all()
+   return conditional_json( request, Students)
    
-   return [ eachStudent._asdict() for eachStudent in Students]
+@router.get("/schedule:export")
+async def export_student_schedule( request: Request, format: Union[ str, None] = None, fields: Union[ str, None] = None):
+   # the whole table for dataframe loads, as arrow ipc or parquet straight from snowflake's arrow batches
+   return await export_query( globalSessionFactory, student_schedule, [], request, format, fields)
 
-@router.get("/student/{student_id}/schedule")
-async def get_student_schedule( student_id: str):
-   Schedule = globalSession.query( student_schedule).filter( student_schedule.studentid == student_id).all()
-   
-   return [ eachSchedule._asdict() for eachSchedule in Schedule]   
+# the keyed lookups, each endpoint generated with its statement built once
+add_lookup_routes( router, globalSessionFactory, get_session, [
+   lookupRoute( "/student/{student_id}", student, [ student.personid], catalog=studentCatalog, cache=True),
+   lookupRoute( "/student/{student_id}/schedule", student_schedule, [ student_schedule.studentid], cache=True, stream=True, page=True),
+   lookupRoute( "/student/{student_id}/schedule/{schedule_id}", student_schedule, [ student_schedule.studentid, student_schedule.courseid], cache=True, stream=True),
+   lookupRoute( "/schedule/{schedule_id}", student_schedule, [ student_schedule.courseid], cache=True, stream=True, page=True),
+   lookupRoute( "/schedule/{schedule_id}/day/{day}", student_schedule, [ student_schedule.courseid, student_schedule.day], cache=True, stream=True, page=True),
+])
 
-@router.get("/student/{student_id}/schedule/{schedule_id}")
-async def get_student_schedule( student_id: str, schedule_id: str):
-   Schedule = globalSession.query( student_schedule).filter( student_schedule.studentid == student_id, student_schedule.courseid == schedule_id).all()
-   
-   return [ eachSchedule._asdict() for eachSchedule in Schedule]   
+@router.post("/student/schedule:batch")
+async def get_student_schedule_batch( batch: studentBatch, session: Session = Depends( get_session)):
+   # many students' schedules in one call, one in (...) query per chunk of ids, grouped by student id
+   Schedule = await run_admitted( warehouseGate, fetch_grouped, session, student_schedule, student_schedule.studentid, batch.ids)
 
-@router.get("/schedule/{schedule_id}")
-async def get_student_schedule( schedule_id: str):
-   Schedule = globalSession.query( student_schedule).filter( student_schedule.courseid == schedule_id).all()
-   
-   return [ eachSchedule._asdict() for eachSchedule in Schedule]   
-
-@router.get("/schedule/{schedule_id}/day/{day}")
-async def get_student_schedule( schedule_id: str, day: str):
-   Schedule = globalSession.query( student_schedule).filter( student_schedule.courseid == schedule_id, student_schedule.day == day).all()
-   
-   return [ eachSchedule._asdict() for eachSchedule in Schedule]   
\ No newline at end of file
+   return FastJSONResponse( Schedule)
@@ -0,0 +1,132 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from utilities.exceptions import OverloadedException
+
+
+class AdmissionGate:
+    """
+    Limits how much work is in flight against one backend, with a bounded wait queue and a deadline
+    on the wait. Work that cannot start in time is turned away at once with a 503 rather than
+    queueing in the backend and slowing everything else down.
+    """
+    def __init__(self, *, name: str, limit: int, queue_depth: int, deadline: float,
+                 status_code: int = 503, retry_after: int = 1) -> None:
+        """
+        Admission gate constructor
+
+        Args:
+            name (str): Gate name, used for error codes
+            limit (int): Calls that may run at once, 0 or less admits everything
+            queue_depth (int): Calls that may wait for a free slot
+            deadline (float): Seconds a call may wait for a slot
+            status_code (int, optional): Status returned when a call is turned away
+            retry_after (int, optional): Retry-After seconds returned when a call is turned away
+        """
+        self.name = name
+        self.limit = limit
+        self.queue_depth = queue_depth
+        self.deadline = deadline
+        self.status_code = status_code
+        self.retry_after = retry_after
+        # moving average of how long a call holds its slot, used to predict the wait
+        self.hold = 0.0
+        self.stats = {"admitted": 0, "queued": 0, "rejected_full": 0, "rejected_early": 0, "timed_out": 0}
+        self._active = 0
+        self._waiters = deque()
+
+    def _reject(self, reason: str, description: str) -> OverloadedException:
+        self.stats[reason] += 1
+        return OverloadedException(
+            status_code=self.status_code,
+            code=f"{self.name}_overloaded",
+            description=description,
+            retry_after=self.retry_after,
+        )
+
+    def expected_wait(self) -> float:
+        """
+        Predicted seconds before a call arriving now would get a slot
+        """
+        if self.limit <= 0:
+            return 0.0
+        return (len(self._waiters) + 1) / self.limit * self.hold
+
+    async def acquire(self):
+        """
+        Wait for a slot, only ever on the event loop so the counters need no lock
+
+        Returns:
+            callable: Releases the slot, safe to call more than once
+
+        Raises:
+            OverloadedException: the queue is full, the predicted wait is past the deadline,
+                or the deadline passed while waiting
+        """
+        if self.limit > 0 and (self._active >= self.limit or self._waiters):
+            if len(self._waiters) >= self.queue_depth:
+                raise self._reject("rejected_full", "Server busy, please retry shortly")
+            # turn the call away now rather than after it has waited out its deadline
+            if self.expected_wait() > self.deadline:
+                raise self._reject("rejected_early", "Server busy, please retry shortly")
+            self.stats["queued"] += 1
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout=self.deadline)
+            except BaseException as ex:
+                if waiter.done() and not waiter.cancelled():
+                    # the slot was handed over just as the wait ended, pass it on
+                    self._release()
+                else:
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        pass
+                if isinstance(ex, asyncio.TimeoutError):
+                    raise self._reject("timed_out", "Server busy, the request could not start in time") from None
+                raise
+        else:
+            self._active += 1
+        self.stats["admitted"] += 1
+        start = time.perf_counter()
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if released:
+                return
+            released = True
+            self.hold = self.hold * 0.9 + (time.perf_counter() - start) * 0.1
+            self._release()
+
+        return release
+
+    def _release(self) -> None:
+        # hand the slot straight to the next live waiter so a newcomer cannot jump the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def admit(self):
+        """
+        Hold a slot for the body of an async with block
+        """
+        release = await self.acquire()
+        try:
+            yield
+        finally:
+            release()
+
+    def report(self) -> dict:
+        """
+        Counters and current occupancy
+        """
+        return dict(self.stats, active=self._active, waiting=len(self._waiters), limit=self.limit,
+                    expected_wait=round(self.expected_wait(), 4))
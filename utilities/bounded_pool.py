@@ -0,0 +1,61 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from utilities.exceptions import OverloadedException
+
+
+class BoundedPool:
+    """
+    Worker pool with a fixed number of threads and a bounded wait queue
+    """
+    def __init__(self, *, name: str, workers: int, queue_depth: int,
+                 status_code: int = 503, retry_after: int = 1) -> None:
+        """
+        Bounded pool constructor
+
+        Args:
+            name (str): Pool name, used for thread names and error codes
+            workers (int): Number of calls that may run at once
+            queue_depth (int): Number of calls that may wait for a free worker
+            status_code (int, optional): Status returned when the pool is full
+            retry_after (int, optional): Retry-After seconds returned when the pool is full
+        """
+        self.name = name
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.rejected = 0
+        self._admitted = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+    @property
+    def admitted(self) -> int:
+        """
+        Number of calls running or waiting
+        """
+        return self._admitted
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run a blocking callable on the pool, failing fast when the pool is full
+
+        Raises:
+            OverloadedException: the workers and the wait queue are all taken
+        """
+        # the counter is only touched on the event loop so it needs no lock
+        if self._admitted >= self.workers + self.queue_depth:
+            self.rejected += 1
+            raise OverloadedException(
+                status_code=self.status_code,
+                code=f"{self.name}_overloaded",
+                description="Server busy, please retry shortly",
+                retry_after=self.retry_after,
+            )
+        self._admitted += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+        finally:
+            self._admitted -= 1
@@ -0,0 +1,236 @@
+import asyncio
+import os
+import time
+import zlib
+from typing import Union
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from utilities.conditional import encoded_etag, request_etags
+from utilities.metrics import MetricsRegistry, metrics
+
+# bodies smaller than this go out as they are, compressing them costs more than it saves
+compressionMinimumBytes = int(os.environ.get("CompressionMinimumBytes", "1024"))
+
+# gzip level 1-9 and zstd level 1-22, lower levels favour latency over bandwidth
+gzipLevel = int(os.environ.get("CompressionGzipLevel", "5"))
+zstdLevel = int(os.environ.get("CompressionZstdLevel", "3"))
+
+# bodies or stream chunks at least this size are compressed off the event loop
+compressionOffloadBytes = int(os.environ.get("CompressionOffloadBytes", str(256 * 1024)))
+
+# media types worth compressing, parquet and images are compressed already
+compressibleTypes = ("text/", "application/json", "application/x-ndjson", "application/vnd.apache.arrow.stream")
+
+# upper bounds for response sizes in bytes
+byteBuckets = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+metrics.describe("http_response_bytes", "Bytes of response body sent, by route and content encoding")
+metrics.describe("http_response_uncompressed_bytes", "Bytes of response body before any compression")
+metrics.describe("http_compression_cpu_seconds", "CPU time spent compressing each response")
+
+
+def _zstandard():
+    """
+    The zstandard module, or None when it is not installed
+    """
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+class GzipCompressor:
+    """
+    Incremental gzip, each chunk is flushed so a streaming client can decode it straight away
+    """
+    def __init__(self) -> None:
+        self._compressor = zlib.compressobj(gzipLevel, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> tuple:
+        """
+        Compress the next chunk
+
+        Args:
+            data (bytes): Uncompressed chunk
+            final (bool): True for the last chunk of the body
+
+        Returns:
+            tuple: The compressed bytes and the CPU seconds spent on them
+        """
+        start = time.thread_time()
+        out = self._compressor.compress(data)
+        out += self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+        return out, time.thread_time() - start
+
+
+class ZstdCompressor:
+    """
+    Incremental zstd, each chunk is flushed as a complete block
+    """
+    def __init__(self, zstandard) -> None:
+        self._zstandard = zstandard
+        self._compressor = zstandard.ZstdCompressor(level=zstdLevel).compressobj()
+
+    def compress(self, data: bytes, final: bool) -> tuple:
+        """
+        Compress the next chunk
+
+        Args:
+            data (bytes): Uncompressed chunk
+            final (bool): True for the last chunk of the body
+
+        Returns:
+            tuple: The compressed bytes and the CPU seconds spent on them
+        """
+        start = time.thread_time()
+        out = self._compressor.compress(data)
+        if final:
+            out += self._compressor.flush()
+        else:
+            out += self._compressor.flush(self._zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return out, time.thread_time() - start
+
+
+def available_encodings() -> list:
+    """
+    Encodings this process can produce, most preferred first
+    """
+    return ["zstd", "gzip"] if _zstandard() is not None else ["gzip"]
+
+
+def choose_encoding(accept_encoding: str, encodings: list) -> Union[str, None]:
+    """
+    Pick the encoding the client weights highest, ties going to the first in our own order
+
+    Args:
+        accept_encoding (str): The Accept-Encoding request header
+        encodings (list): Encodings we can produce, most preferred first
+
+    Returns:
+        str: The chosen encoding, None to send the body as it is
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[token] = weight
+    best, best_weight = None, 0.0
+    for encoding in encodings:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def _compressor(encoding: str):
+    if encoding == "zstd":
+        return ZstdCompressor(_zstandard())
+    return GzipCompressor()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses response bodies with the best encoding the client accepts.
+    Small bodies go out unchanged, streamed bodies are compressed chunk by chunk as they are sent,
+    and every response records its bytes before and after and the CPU time compression took.
+    """
+    def __init__(self, app, minimum_size: int = compressionMinimumBytes, registry: MetricsRegistry = metrics) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.registry = registry
+        self.encodings = available_encodings()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""), self.encodings)
+        start_message = None
+        compressor = None
+        used = "identity"
+        sent = 0
+        raw = 0
+        cpu = 0.0
+
+        async def compress(data: bytes, final: bool) -> bytes:
+            nonlocal cpu
+            if len(data) >= compressionOffloadBytes:
+                # zlib and zstd release the gil, so a large body doesn't hold up other requests
+                out, seconds = await asyncio.get_running_loop().run_in_executor(None, compressor.compress, data, final)
+            else:
+                out, seconds = compressor.compress(data, final)
+            cpu += seconds
+            return out
+
+        def record() -> None:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.registry.observe("http_response_bytes", (("route", route), ("encoding", used)), sent, byteBuckets)
+            self.registry.observe("http_response_uncompressed_bytes", (("route", route),), raw, byteBuckets)
+            if compressor is not None:
+                self.registry.observe("http_compression_cpu_seconds", (("route", route), ("encoding", used)), cpu)
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, used, sent, raw
+            if message["type"] == "http.response.start":
+                # hold the headers back until the first body chunk shows whether to compress
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            raw += len(body)
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                media_type = headers.get("content-type", "")
+                if (encoding is not None
+                        and start_message["status"] not in (204, 304)
+                        and "content-encoding" not in headers
+                        and media_type.startswith(compressibleTypes)
+                        and (more or len(body) >= self.minimum_size)):
+                    compressor = _compressor(encoding)
+                    used = encoding
+                    del headers["content-length"]
+                    headers["content-encoding"] = encoding
+                    # the compressed bytes differ, so they get their own strong validator
+                    etag = headers.get("etag")
+                    if etag and not etag.startswith("W/"):
+                        headers["etag"] = encoded_etag(etag, encoding)
+                    body = await compress(body, not more)
+                    if not more:
+                        headers["content-length"] = str(len(body))
+                elif start_message["status"] == 304 and headers.get("etag"):
+                    # answer with the tag the client's compressed copy carries, the one for the
+                    # encoding chosen now if the client holds several
+                    held = request_etags(request_headers)
+                    tags = [encoded_etag(headers["etag"], name) for name in [encoding] + self.encodings if name]
+                    for tag in tags:
+                        if tag in held:
+                            headers["etag"] = tag
+                            break
+                # caches must key the response on what the client said it accepts
+                headers.add_vary_header("Accept-Encoding")
+                await send(start_message)
+                start_message = None
+            elif compressor is not None:
+                body = await compress(body, not more)
+            sent += len(body)
+            await send({"type": "http.response.body", "body": body, "more_body": more})
+            if not more:
+                record()
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,132 @@
+import hashlib
+import os
+
+from fastapi import Request, Response
+
+from utilities.responses import FastJSONResponse, dumps
+
+# seconds a client may reuse a response before revalidating, responses are per user so private
+httpCacheMaxAge = int(os.environ.get("HttpCacheMaxAge", "60"))
+
+# content codings the compression middleware may add to an ETag
+etagEncodings = ("gzip", "zstd")
+
+
+def cache_control() -> str:
+    """
+    Cache-Control value for cacheable responses
+    """
+    return f"private, max-age={httpCacheMaxAge}, must-revalidate"
+
+
+def content_etag(body: bytes) -> str:
+    """
+    Strong ETag from the exact bytes of a response body
+
+    Args:
+        body (bytes): Encoded response body
+
+    Returns:
+        str: Quoted ETag
+    """
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def version_etag(version: str, request: Request) -> str:
+    """
+    Strong ETag from a data version and the request, without building the response.
+    The path and query string are part of it because each one selects different rows.
+
+    Args:
+        version (str): Version of the data the response is built from
+        request (Request): The request being answered
+
+    Returns:
+        str: Quoted ETag
+    """
+    query = "&".join(sorted(f"{key}={value}" for key, value in request.query_params.multi_items()))
+    identity = f"{version}|{request.url.path}|{query}".encode()
+    return '"' + hashlib.blake2b(identity, digest_size=16).hexdigest() + '"'
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """
+    Strong ETag of the same response sent with a content coding. The compressed bytes differ from
+    the plain ones, so the tag differs too rather than being weakened.
+
+    Args:
+        etag (str): Quoted ETag of the uncompressed response
+        encoding (str): Content coding the body is sent with
+
+    Returns:
+        str: Quoted ETag, e.g. "<hash>-gzip"
+    """
+    return etag[:-1] + "-" + encoding + '"'
+
+
+def request_etags(request_headers) -> list:
+    """
+    The tags named in If-None-Match, with any weak prefix dropped
+    """
+    header = request_headers.get("if-none-match")
+    if not header:
+        return []
+    return [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+
+def _unencoded(tag: str) -> str:
+    for encoding in etagEncodings:
+        suffix = "-" + encoding + '"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    True if the request's If-None-Match already names this ETag
+
+    Args:
+        request (Request): The request being answered
+        etag (str): Quoted ETag of the current response
+    """
+    tags = request_etags(request.headers)
+    if tags == ["*"]:
+        return True
+    # weak validators compare equal to strong ones for If-None-Match, and a compressed form of the
+    # response names the same content
+    return etag in (_unencoded(tag) for tag in tags)
+
+
+def not_modified(etag: str) -> Response:
+    """
+    Empty 304 response carrying the validators, the compression middleware swaps in the encoded
+    tag when that is the one the client holds
+    """
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control()})
+
+
+def conditional_json(request: Request, content) -> Response:
+    """
+    Encode content once, tag it with a content hash and answer 304 if the client already has it
+
+    Args:
+        request (Request): The request being answered
+        content: JSON compatible content
+
+    Returns:
+        Response: 304 when If-None-Match matches, otherwise the JSON body with its ETag
+    """
+    body = dumps(content)
+    etag = content_etag(body)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return Response(content=body, media_type=FastJSONResponse.media_type,
+                    headers={"ETag": etag, "Cache-Control": cache_control()})
+
+
+def versioned_json(content, etag: str) -> FastJSONResponse:
+    """
+    JSON response tagged with an ETag that was worked out from a data version
+    """
+    return FastJSONResponse(content, headers={"ETag": etag, "Cache-Control": cache_control()})
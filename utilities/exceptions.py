@@ -2,17 +2,19 @@ class ApiException(Exception):
     """
     Generic API Exception
     """
-    def __init__(self, *, status_code: int, code: str, description: str) -> None:
+    def __init__(self, *, status_code: int, code: str, description: str, headers: dict = None) -> None:
         """
         API exception constructor
         Args:
             status_code (int): HTTP status code
             code (str): Error code
             description (str): Error description
+            headers (dict, optional): Extra response headers, e.g. Retry-After
         """
         self.status_code = status_code
         self.code = code
         self.description = description
+        self.headers = headers
 
 
 class EntityNotFoundException(ApiException):
@@ -26,4 +28,22 @@ class EntityNotFoundException(ApiException):
             code (str): Entity name
             description (str): Error description
         """
-        super().__init__(status_code=404, code=code, description=description)
\ No newline at end of file
+        super().__init__(status_code=404, code=code, description=description)
+
+
+class OverloadedException(ApiException):
+    """
+    Work rejected because a bounded pool is full
+    """
+    def __init__(self, *, code: str, description: str, status_code: int = 503, retry_after: int = 1) -> None:
+        """
+        Overloaded exception constructor
+
+        Args:
+            code (str): Error code
+            description (str): Error description
+            status_code (int, optional): HTTP status code, 503 or 429
+            retry_after (int, optional): Seconds the client should wait before retrying
+        """
+        super().__init__(status_code=status_code, code=code, description=description,
+                         headers={"Retry-After": str(retry_after)})
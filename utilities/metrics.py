@@ -0,0 +1,219 @@
+import bisect
+import threading
+import time
+
+# upper bounds in seconds, from a cached lookup to a slow warehouse scan
+latencyBuckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# upper bounds for row counts
+rowBuckets = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+class Histogram:
+    """
+    Fixed bucket histogram, cheap enough to observe on every request and query
+    """
+    def __init__(self, buckets: tuple = latencyBuckets) -> None:
+        """
+        Histogram constructor
+
+        Args:
+            buckets (tuple, optional): Sorted upper bounds, an overflow bucket is added after the last
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Add one observation, the caller holds the registry lock
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in
+
+        Args:
+            q (float): Quantile between 0 and 1
+
+        Returns:
+            float: The estimate, the largest value seen if it falls in the overflow bucket
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """
+        Count, mean, max and estimated percentiles
+        """
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": round(self.quantile(0.50), 6),
+            "p95": round(self.quantile(0.95), 6),
+            "p99": round(self.quantile(0.99), 6),
+            "max": round(self.max, 6),
+        }
+
+
+class MetricsRegistry:
+    """
+    Named histograms and counters, each keyed by a tuple of label pairs
+    """
+    def __init__(self) -> None:
+        """
+        Metrics registry constructor
+        """
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, text: str) -> None:
+        """
+        Set the HELP text shown for a metric in the Prometheus output
+        """
+        self._help[name] = text
+
+    def observe(self, name: str, labels: tuple, value: float, buckets: tuple = latencyBuckets) -> None:
+        """
+        Add an observation to a histogram
+
+        Args:
+            name (str): Metric name
+            labels (tuple): Label pairs, e.g. (("route", "/caprice/product"), ("method", "GET"))
+            value (float): The observed value
+            buckets (tuple, optional): Bucket bounds used if this is the first observation
+        """
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, labels: tuple, amount: int = 1) -> None:
+        """
+        Add to a counter
+
+        Args:
+            name (str): Metric name
+            labels (tuple): Label pairs
+            amount (int, optional): How much to add
+        """
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + amount
+
+    def summary(self, name: str) -> list:
+        """
+        Summaries of every series of a histogram
+
+        Returns:
+            list: One dictionary per series holding its labels and its summary
+        """
+        with self._lock:
+            return [dict(labels, **histogram.summary()) for labels, histogram in self._histograms.get(name, {}).items()]
+
+    def counters(self, name: str) -> list:
+        """
+        Every series of a counter
+
+        Returns:
+            list: One dictionary per series holding its labels and its value
+        """
+        with self._lock:
+            return [dict(labels, value=value) for labels, value in self._counters.get(name, {}).items()]
+
+    def prometheus(self) -> str:
+        """
+        Every metric in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels, ('le', repr(float(bound))))} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(labels, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple, *extra) -> str:
+    """
+    Render label pairs as {name="value",...}
+    """
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    rendered = []
+    for key, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        rendered.append(f'{key}="{value}"')
+    return "{" + ",".join(rendered) + "}"
+
+
+metrics = MetricsRegistry()
+metrics.describe("http_request_duration_seconds", "Time to produce each response, by route template")
+metrics.describe("http_errors_total", "Responses with a 4xx or 5xx status and unhandled exceptions")
+
+
+class RouteMetricsMiddleware:
+    """
+    ASGI middleware that records the latency of every request against its route template,
+    so /caprice/product/1 and /caprice/product/2 fall in the same series
+    """
+    def __init__(self, app, registry: MetricsRegistry = metrics) -> None:
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # the router records the matched route on the scope, unmatched paths share one series
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            labels = (("route", path), ("method", scope["method"]))
+            self.registry.observe("http_request_duration_seconds", labels, time.perf_counter() - start)
+            if status >= 400:
+                self.registry.inc("http_errors_total", labels + (("status", status),))
@@ -0,0 +1,33 @@
+import json
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt, the fallback keeps local runs working
+    orjson = None
+
+
+def dumps(content) -> bytes:
+    """
+    Encode content as compact JSON bytes, using orjson when it is installed
+
+    Args:
+        content: JSON compatible content, anything else is written with str()
+
+    Returns:
+        bytes: The encoded document
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=str, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response encoded with the fast encoder
+
+    Returning one of these from a route skips FastAPI's generic jsonable_encoder pass.
+    """
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,104 @@
+import importlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """
+    Records how long each part of a cold start takes, up to the first response sent
+    """
+    def __init__(self) -> None:
+        """
+        Startup timer constructor, the clock starts when this module is first imported
+        """
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.first_response = None
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        """
+        Record the duration of a startup phase
+
+        Args:
+            name (str): Phase name, e.g. "import sqlalchemy" or "engine Snowflake"
+            seconds (float): How long the phase took
+        """
+        with self._lock:
+            self.phases[name] = round(seconds * 1000, 2)
+
+    @contextmanager
+    def measure(self, name: str):
+        """
+        Time the body of a with block as a startup phase
+
+        Args:
+            name (str): Phase name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def import_modules(self, names: list) -> None:
+        """
+        Import modules one at a time so each one's cost is recorded separately.
+        A module already imported by an earlier entry shows up as close to zero.
+
+        Args:
+            names (list): Module names in the order to import them
+        """
+        for name in names:
+            with self.measure(f"import {name}"):
+                importlib.import_module(name)
+
+    def mark_first_response(self) -> None:
+        """
+        Record the time to the first response and log the startup report
+        """
+        with self._lock:
+            if self.first_response is not None:
+                return
+            self.first_response = round((time.perf_counter() - self.started) * 1000, 2)
+        logger.info("startup timing: %s", self.report())
+
+    def report(self) -> dict:
+        """
+        Startup report, all times in milliseconds
+
+        Returns:
+            dict: Phase durations, time since start and time to first response
+        """
+        with self._lock:
+            return {
+                "phases_ms": dict(self.phases),
+                "uptime_ms": round((time.perf_counter() - self.started) * 1000, 2),
+                "first_response_ms": self.first_response,
+            }
+
+
+startupTimer = StartupTimer()
+
+
+class FirstResponseMiddleware:
+    """
+    ASGI middleware that marks the first response sent by the process, then gets out of the way
+    """
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or startupTimer.first_response is not None:
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                startupTimer.mark_first_response()
+            await send(message)
+
+        return await self.app(scope, receive, send_wrapper)